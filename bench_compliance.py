@@ -0,0 +1,52 @@
+import random
+import timeit
+from pyDatalog import pyDatalog
+from compliance import ComplianceModule, BRAKE_DISTANCE
+
+# The original join-based obstacle rule, kept here as the baseline for comparison
+pyDatalog.create_terms('ID, S1, S2, X1, X2, Y1, Y2, legacy_brake_obstacle, obstacle, ego_position, ego_speed')
+legacy_brake_obstacle(ID) <= obstacle(ID, S1, X1, Y1) & ego_position(X2, Y2) & ego_speed(S2) & (((X1 + S1) - (X2 + S2)) < BRAKE_DISTANCE)
+
+OBSTACLE_COUNTS = [1, 4, 16, 64, 256, 1024]
+REPEATS = 20
+
+def add_frame(obstacles):
+    ComplianceModule.add_fact('ego_speed', 30)
+    ComplianceModule.add_fact('ego_position', 0, 300)
+    for obstacle in obstacles:
+        ComplianceModule.add_fact('obstacle', *obstacle)
+
+def indexed_lookup(obstacles):
+    add_frame(obstacles)
+    derived = ComplianceModule.range_facts(ComplianceModule._facts[0], 0)
+    ComplianceModule.reset()
+    return derived
+
+def legacy_lookup(obstacles):
+    pyDatalog.assert_fact('ego_speed', 30)
+    pyDatalog.assert_fact('ego_position', 0, 300)
+    for obstacle in obstacles:
+        pyDatalog.assert_fact('obstacle', *obstacle)
+    result = legacy_brake_obstacle(ID)
+    for obstacle in obstacles:
+        pyDatalog.retract_fact('obstacle', *obstacle)
+    pyDatalog.retract_fact('ego_speed', 30)
+    pyDatalog.retract_fact('ego_position', 0, 300)
+    return result
+
+def full_update(obstacles):
+    add_frame(obstacles)
+    return ComplianceModule.update()
+
+def main():
+    random.seed(0)
+    print(f"{'obstacles':>10} {'index (ms)':>12} {'join (ms)':>12} {'update (ms)':>12}")
+    for n in OBSTACLE_COUNTS:
+        obstacles = [(i, random.uniform(0, 40), random.uniform(150, 5000), 300) for i in range(n)]
+        index_ms = timeit.timeit(lambda: indexed_lookup(obstacles), number=REPEATS) / REPEATS * 1000
+        join_ms = timeit.timeit(lambda: legacy_lookup(obstacles), number=REPEATS) / REPEATS * 1000
+        update_ms = timeit.timeit(lambda: full_update(obstacles), number=REPEATS) / REPEATS * 1000
+        print(f"{n:>10} {index_ms:>12.3f} {join_ms:>12.3f} {update_ms:>12.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,74 +1,214 @@
 from pyDatalog import pyDatalog
-import math
-
-pyDatalog.create_terms(
-    """
-    math,
-    X, Y, Z, D, 
-    ID,
-    D1, D2, D3, D4,
-    S1, S2, 
-    X1, X2, 
-    Y1, Y2,
-    Z1, Z2,
-    DX, DY,
-    traffic_signal, 
-    obstacle, 
-    collision,
-    ego_speed, 
-    ego_position,
-    speed_limit, 
-    action,
-    moving,
-    close_to,
-    predict_collision,
-    current_compliance_action,
-    distance,
-    weather
-    """)
-
-# Fact Definitions
-+traffic_signal(-1, -1, 'green')
-+obstacle(-1, -1, 1000000, 0)
-+collision(False)
-
-# Rule Definitions
-moving() <= ego_speed(X) & (X > 0)
-
-close_to(X1, Y1, D1, D2) <= ego_position(X2, Y2) & ((X1 - X2) < D1)
-predict_collision(X1, Y1, S1, D1, D2) <= ego_position(X2, Y2) & ego_speed(S2) & (((X1 + S1) - (X2 + S2)) < D1)
-
-action('stop_collision') <= collision(True)
-action('slow_signal') <= traffic_signal(ID, X1, 'yellow') & moving() & close_to(X1, 0, 500, 1000)
-action('slow_limit') <= ego_speed(X) & speed_limit(Y) & (X > Y)
-action('slow_obstacle') <= obstacle(ID, S1, X1, Y1) & moving() & predict_collision(X1, Y1, S1, 500, 50)
-action('brake_signal') <= traffic_signal(ID, X1, 'red') & moving() & close_to(X1, Y1, 200, 1000)
-action('brake_obstacle') <= obstacle(ID, S1, X1, Y1) & moving() & predict_collision(X1, Y1, S1, 200, 50)
-
-# New Rule for Weather Conditions
-action('slow_weather') <= weather('Rain')
-action('slow_weather') <= weather('Snow')
-
-current_compliance_action(X) <= action(X)
+from collections import OrderedDict
+import bisect
+from rules import W, X, current_compliance_action, SLOW_DISTANCE, BRAKE_DISTANCE, MERGE_TIME, RULE_FACTS
+
+class RangeIndex:
+    # Numeric keys kept sorted so "key < bound" lookups are a bisect
+    def __init__(self):
+        self.keys = []
+
+    def insert(self, key):
+        bisect.insort(self.keys, key)
+
+    def count_below(self, bound):
+        return bisect.bisect_left(self.keys, bound)
+
+def _obstacle_key(values):
+    obstacle_id, speed, x, y = values
+    return x + speed
+
+def quantize_facts(facts, derived):
+    # Reduce a frame's facts to the comparisons the rules actually make, so two
+    # frames with the same signature are guaranteed to produce the same actions.
+    # Obstacle and signal distances are already reduced to the derived range facts.
+    values = dict(facts)
+    speed = values['ego_speed'][0] if 'ego_speed' in values else None
+
+    signature = set(derived)
+    for f, v in facts:
+        if f in ('traffic_signal', 'obstacle', 'ego_position'):
+            continue
+        elif f == 'ego_speed':
+            signature.add(('moving', v[0] > 0))
+        elif f == 'speed_limit':
+            signature.add((f, None if speed is None else speed > v[0]))
+        elif f == 'lane_change':
+            signature.add((f, v[0] < MERGE_TIME, v[1] < MERGE_TIME))
+        else:
+            signature.add((f,) + tuple(v))
+    return frozenset(signature)
+
+class DecisionCache:
+    def __init__(self, max_size=1024, strict=False):
+        self.max_size = max_size
+        self.strict = strict
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        actions = self.entries.get(key)
+        if actions is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return actions
+
+    def put(self, key, actions):
+        self.entries[key] = actions
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'hit_rate': self.hits / lookups if lookups else 0.0
+        }
 
 class ComplianceModule():
-    _facts = []
+    _world = 0
+    _facts = {}
+    _obstacles = {}
+    _signals = {}
+    _cache = None
+
+    @staticmethod
+    def begin_world(world):
+        # Facts added from now on belong to this world, which starts the frame empty
+        ComplianceModule._world = world
+        ComplianceModule.reset(world)
+
+    @staticmethod
+    def select_world(world):
+        ComplianceModule._world = world
 
     @staticmethod
     def add_fact(fact, *values):
-        ComplianceModule._facts.append((fact, values))
-        pyDatalog.assert_fact(fact, *values)
+        # Facts are asserted lazily in update(), so cache hits never touch the reasoner
+        world = ComplianceModule._world
+        ComplianceModule._facts.setdefault(world, []).append((fact, values))
+        if fact == 'obstacle':
+            ComplianceModule._obstacles.setdefault(world, RangeIndex()).insert(_obstacle_key(values))
+        elif fact == 'traffic_signal':
+            _, x, state = values
+            signals = ComplianceModule._signals.setdefault(world, {})
+            signals.setdefault(state, RangeIndex()).insert(x)
+
     @staticmethod
-    def update():
-        actions = current_compliance_action(X)
-        if not actions:
-            actions = ['None']
-        else:
-            actions = [str(a[0]) for a in actions]
+    def range_facts(facts, world=None):
+        if world is None:
+            world = ComplianceModule._world
+        values = dict(facts)
+        if 'ego_position' not in values:
+            return []
+        position = values['ego_position'][0]
+
+        derived = []
+        for state, index in ComplianceModule._signals.get(world, {}).items():
+            for distance in (BRAKE_DISTANCE, SLOW_DISTANCE):
+                if index.count_below(position + distance) > 0:
+                    derived.append(('signal_within', (state, distance)))
 
-        for f, v in ComplianceModule._facts:
+        if 'ego_speed' in values:
+            obstacles = ComplianceModule._obstacles.get(world, RangeIndex())
+            predicted = position + values['ego_speed'][0]
+            for distance in (BRAKE_DISTANCE, SLOW_DISTANCE):
+                if obstacles.count_below(predicted + distance) > 0:
+                    derived.append(('obstacle_within', (distance,)))
+        return derived
+
+    @staticmethod
+    def enable_cache(max_size=1024, strict=False):
+        ComplianceModule._cache = DecisionCache(max_size, strict)
+
+    @staticmethod
+    def disable_cache():
+        ComplianceModule._cache = None
+
+    @staticmethod
+    def cache_stats():
+        return ComplianceModule._cache.stats() if ComplianceModule._cache else None
+
+    @staticmethod
+    def evaluate_many(world_facts):
+        # One assert pass and one query for every world; results are split by world id
+        asserted = []
+        for world, (facts, derived) in world_facts.items():
+            for f, v in facts + derived:
+                if f in RULE_FACTS:
+                    asserted.append((f, (world,) + tuple(v)))
+
+        for f, v in asserted:
+            pyDatalog.assert_fact(f, *v)
+
+        actions = {world: [] for world in world_facts}
+        for world, action in current_compliance_action(W, X):
+            actions[world].append(str(action))
+
+        for f, v in asserted:
             pyDatalog.retract_fact(f, *v)
 
-        ComplianceModule._facts = []
+        return {world: a or ['None'] for world, a in actions.items()}
 
-        return actions
+    @staticmethod
+    def evaluate(facts, derived=None, world=None):
+        if world is None:
+            world = ComplianceModule._world
+        if derived is None:
+            derived = ComplianceModule.range_facts(facts, world)
+        return ComplianceModule.evaluate_many({world: (facts, derived)})[world]
+
+    @staticmethod
+    def update_all():
+        cache = ComplianceModule._cache
+        pending = {}
+        keys = {}
+        cached = {}
+        for world, facts in ComplianceModule._facts.items():
+            derived = ComplianceModule.range_facts(facts, world)
+            if cache is not None:
+                keys[world] = quantize_facts(facts, derived)
+                actions = cache.get(keys[world])
+                if actions is not None:
+                    cached[world] = actions
+                    if not cache.strict:
+                        continue
+            pending[world] = (facts, derived)
+
+        results = ComplianceModule.evaluate_many(pending) if pending else {}
+        for world, actions in results.items():
+            if world in cached:
+                if sorted(actions) != sorted(cached[world]):
+                    raise AssertionError(f"Cached compliance actions {cached[world]} differ from reasoner result {actions} for facts {pending[world][0]}")
+            elif cache is not None:
+                cache.put(keys[world], actions)
+        results.update(cached)
+
+        ComplianceModule.reset()
+        return {world: list(actions) for world, actions in results.items()}
+
+    @staticmethod
+    def update(world=None):
+        if world is None:
+            world = ComplianceModule._world
+        return ComplianceModule.update_all().get(world, ['None'])
+
+    @staticmethod
+    def reset(world=None):
+        if world is None:
+            ComplianceModule._facts = {}
+            ComplianceModule._obstacles = {}
+            ComplianceModule._signals = {}
+        else:
+            ComplianceModule._facts.pop(world, None)
+            ComplianceModule._obstacles.pop(world, None)
+            ComplianceModule._signals.pop(world, None)
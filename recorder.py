@@ -0,0 +1,146 @@
+import os
+import shutil
+import multiprocessing as mp
+from collections import deque
+from multiprocessing import shared_memory
+from queue import Empty
+
+import numpy as np
+import pygame
+
+PNG = "png"
+RAW = "raw"
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024
+MIN_BUFFERS = 8
+
+def shared_memory_free():
+    # Free space backing shared memory; writing past it ends in SIGBUS rather than an error
+    try:
+        return shutil.disk_usage("/dev/shm").free
+    except OSError:
+        return None
+
+def _write_frames(shm_name, shape, jobs, done, output_dir, fmt):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    frames = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+    raw_file = open(os.path.join(output_dir, "frames.rgb"), "ab") if fmt == RAW else None
+    index_file = open(os.path.join(output_dir, "frames.txt"), "a")
+    if fmt == RAW and index_file.tell() == 0:
+        # Raw video is packed rgb24, row-major; frames.txt lists which sim frames it holds
+        index_file.write(f"# {shape[1]}x{shape[2]} rgb24\n")
+
+    while True:
+        job = jobs.get()
+        if job is None:
+            break
+        frame, slot = job
+        if fmt == RAW:
+            raw_file.write(frames[slot].transpose(1, 0, 2).tobytes())
+        else:
+            pygame.image.save(pygame.surfarray.make_surface(frames[slot]), os.path.join(output_dir, f"frame_{frame:07d}.png"))
+        index_file.write(f"{frame}\n")
+        done.put(slot)
+
+    index_file.close()
+    if raw_file:
+        raw_file.close()
+    del frames
+    shm.close()
+
+class FrameRecorder:
+    # Copies each captured frame into a preallocated shared-memory slot and hands the slot
+    # to a writer process, so encoding never runs in the simulation loop. When the writer
+    # falls behind, frames are skipped (and counted in dropped) rather than stalling the sim.
+    # With incident_window set, only frames within that many seconds of an incident are written.
+    # The ring is sized to memory_budget bytes and to the free space in /dev/shm; if the window
+    # before an incident doesn't fit, it is shortened and a warning is printed.
+    def __init__(self, surface, output_dir, fmt=PNG, incident_window=None, fps=60, buffers=120, scale=1, memory_budget=DEFAULT_MEMORY_BUDGET):
+        width, height = surface.get_size()
+        self.scale = scale
+        self.shape_per_frame = (len(range(0, width, scale)), len(range(0, height, scale)), 3)
+        frame_bytes = int(np.prod(self.shape_per_frame))
+
+        free = shared_memory_free()
+        if free is not None:
+            memory_budget = min(memory_budget, int(free * 0.9))
+        max_count = memory_budget // frame_bytes
+        if max_count < MIN_BUFFERS:
+            raise ValueError(f"Recording needs at least {MIN_BUFFERS * frame_bytes / 2**20:.1f} MB of shared memory for "
+                             f"{MIN_BUFFERS} {self.shape_per_frame[0]}x{self.shape_per_frame[1]} frames, but only "
+                             f"{memory_budget / 2**20:.1f} MB is available; use a larger scale or a bigger budget")
+
+        # At least a quarter of the ring stays free for frames in flight to the writer
+        live = min(buffers, max(MIN_BUFFERS, max_count // 4))
+        self.after_frames = int(incident_window * fps) if incident_window else 0
+        self.window_frames = min(self.after_frames, max_count - live)
+        if self.window_frames < self.after_frames:
+            print(f"Recorder: shared memory holds {self.window_frames / fps:.1f}s before an incident instead of {incident_window}s")
+        count = min(buffers, max_count - self.window_frames) + self.window_frames
+        shape = (count,) + self.shape_per_frame
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)))
+        self.frames = np.ndarray(shape, dtype=np.uint8, buffer=self.shm.buf)
+        self.free = deque(range(count))
+        self.history = deque()
+        self.jobs = mp.Queue()
+        self.done = mp.Queue()
+        self.worker = mp.Process(target=_write_frames, args=(self.shm.name, shape, self.jobs, self.done, output_dir, fmt), daemon=True)
+        self.worker.start()
+
+        self.incident_window = incident_window
+        self.record_until = -1
+        self.seen_incidents = 0
+        self.recorded = 0
+        self.dropped = 0
+
+    def reclaim(self):
+        while True:
+            try:
+                self.free.append(self.done.get_nowait())
+            except Empty:
+                break
+
+    def send(self, frame, slot):
+        self.jobs.put((frame, slot))
+        self.recorded += 1
+
+    def capture(self, game, surface):
+        self.reclaim()
+        frame = game.game_frame
+
+        if self.incident_window:
+            incidents = game.car.incident_report.total_incidents
+            if incidents > self.seen_incidents:
+                self.seen_incidents = incidents
+                self.record_until = frame + self.after_frames
+                while self.history:
+                    self.send(*self.history.popleft())
+            recording = frame <= self.record_until
+        else:
+            recording = True
+
+        if not self.free:
+            self.dropped += 1
+            return
+
+        slot = self.free.popleft()
+        pixels = pygame.surfarray.pixels3d(surface)
+        self.frames[slot] = pixels[::self.scale, ::self.scale]
+        del pixels  # releases the surface lock
+
+        if recording:
+            self.send(frame, slot)
+        else:
+            # Keep the last window of frames around in case an incident follows
+            self.history.append((frame, slot))
+            while len(self.history) > self.window_frames:
+                self.free.append(self.history.popleft()[1])
+
+    def close(self):
+        self.jobs.put(None)
+        self.worker.join()
+        del self.frames
+        self.shm.close()
+        self.shm.unlink()
@@ -0,0 +1,271 @@
+import os
+import sys
+import copy
+import tempfile
+import argparse
+import subprocess
+import importlib.util
+import multiprocessing as mp
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Runs a scenario corpus through two versions of rules.py and reports where their
+# compliance_actions timelines differ. Only the rules are swapped; the engine in
+# compliance.py and the simulator are the current ones. pyDatalog rules are global to a
+# process, so each rule version gets its own pool of spawned workers that load it as the
+# 'rules' module before the engine is imported. Workers send back only the frames where
+# the action set changes, and the two change-point streams are diffed in one pass.
+
+MAX_EXAMPLES = 10
+
+_rules_error = None
+
+def load_rules(path):
+    # Runs as the pool initializer; an exception here would only surface as a broken pool
+    global _rules_error
+    try:
+        spec = importlib.util.spec_from_file_location("rules", path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["rules"] = module
+        spec.loader.exec_module(module)
+    except Exception as e:
+        _rules_error = f"{type(e).__name__}: {e}"
+
+def check_rules():
+    # Load the engine on top of the rules and evaluate one empty frame
+    if _rules_error:
+        return _rules_error
+    try:
+        from compliance import ComplianceModule
+        ComplianceModule.evaluate([('ego_speed', (0,))], [], world=0)
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+def resolve_rules(spec, workdir):
+    # A path to a rules.py, or a git revision whose rules.py is used
+    if os.path.isfile(spec):
+        return os.path.abspath(spec)
+    source = subprocess.run(["git", "show", f"{spec}:rules.py"], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    if source.returncode != 0:
+        raise ValueError(f"'{spec}' is neither a file nor a git revision with rules.py "
+                         f"(revisions from before the rules moved out of compliance.py can't run on the current engine): {source.stderr.strip()}")
+    path = os.path.join(workdir, f"rules_{len(os.listdir(workdir))}.py")
+    with open(path, "w") as f:
+        f.write(source.stdout)
+    return path
+
+def trace_scenario(scenario):
+    if _rules_error:
+        raise RuntimeError(_rules_error)
+    # Imported here so the worker's rule version is already in sys.modules
+    from scenario import play_scenario
+    changes = []
+    current = frozenset()
+    for frame, game in play_scenario(scenario):
+        actions = frozenset(a for a in game.compliance_actions if a != 'None')
+        if actions != current:
+            changes.append((frame, actions))
+            current = actions
+    return changes
+
+class ActionDiff:
+    def __init__(self):
+        self.new = 0
+        self.missing = 0
+        self.delayed = 0
+        self.delay_total = 0
+        self.frames_added = 0
+        self.frames_removed = 0
+
+    def merge(self, other):
+        self.new += other.new
+        self.missing += other.missing
+        self.delayed += other.delayed
+        self.delay_total += other.delay_total
+        self.frames_added += other.frames_added
+        self.frames_removed += other.frames_removed
+
+    @property
+    def changed(self):
+        return self.new or self.missing or self.delayed or self.frames_added or self.frames_removed
+
+    def __str__(self):
+        delay = f" (mean {self.delay_total / self.delayed:+.1f} frames)" if self.delayed else ""
+        return (f"new {self.new}, missing {self.missing}, delayed {self.delayed}{delay}, "
+                f"frames +{self.frames_added}/-{self.frames_removed}")
+
+class ScenarioDiff:
+    def __init__(self, name):
+        self.name = name
+        self.actions = {}
+        self.examples = []
+
+    def action(self, action):
+        diff = self.actions.get(action)
+        if diff is None:
+            diff = self.actions[action] = ActionDiff()
+        return diff
+
+    def note(self, frame, kind, action, detail=""):
+        if len(self.examples) < MAX_EXAMPLES:
+            self.examples.append((frame, kind, action, detail))
+
+    @property
+    def changed(self):
+        return any(d.changed for d in self.actions.values())
+
+    def __str__(self):
+        lines = [self.name]
+        for action in sorted(self.actions):
+            if self.actions[action].changed:
+                lines.append(f"    {action}: {self.actions[action]}")
+        for frame, kind, action, detail in self.examples:
+            lines.append(f"        frame {frame}: {kind} {action}{detail}")
+        return "\n".join(lines)
+
+def diff_timelines(name, base, candidate, frames, window):
+    # Onsets (an action switching on) are matched between the versions: an onset the other
+    # version has within window frames is delayed, otherwise it is new or missing.
+    # Frame counts cover every frame where an action is in one timeline but not the other.
+    result = ScenarioDiff(name)
+    pending = ({}, {})  # action -> deque of unmatched onset frames, for base and candidate
+    current = [frozenset(), frozenset()]
+    timelines = (iter(base), iter(candidate))
+    upcoming = [next(timelines[0], None), next(timelines[1], None)]
+    last_frame = 0
+
+    def expire(before):
+        for side, kind in ((0, "missing"), (1, "new")):
+            for action, onsets in pending[side].items():
+                while onsets and onsets[0] < before:
+                    frame = onsets.popleft()
+                    diff = result.action(action)
+                    setattr(diff, kind, getattr(diff, kind) + 1)
+                    result.note(frame, kind, action)
+
+    while upcoming[0] or upcoming[1]:
+        frame = min(c[0] for c in upcoming if c)
+        added = current[1] - current[0]
+        removed = current[0] - current[1]
+        for action in added:
+            result.action(action).frames_added += frame - last_frame
+        for action in removed:
+            result.action(action).frames_removed += frame - last_frame
+        last_frame = frame
+        expire(frame - window)
+
+        onsets = [frozenset(), frozenset()]
+        for side in (0, 1):
+            if upcoming[side] and upcoming[side][0] == frame:
+                onsets[side] = upcoming[side][1] - current[side]
+                current[side] = upcoming[side][1]
+                upcoming[side] = next(timelines[side], None)
+
+        for side in (0, 1):
+            other = 1 - side
+            for action in onsets[side] - onsets[other]:
+                waiting = pending[other].get(action)
+                if waiting:
+                    onset = waiting.popleft()
+                    delay = frame - onset if side == 1 else onset - frame
+                    result.action(action).delayed += 1
+                    result.action(action).delay_total += delay
+                    result.note(onset if side == 1 else frame, "delayed", action, f" by {delay:+d} frames")
+                else:
+                    pending[side].setdefault(action, deque()).append(frame)
+
+    for action in current[1] - current[0]:
+        result.action(action).frames_added += frames - last_frame
+    for action in current[0] - current[1]:
+        result.action(action).frames_removed += frames - last_frame
+    expire(float("inf"))
+    return result
+
+def expand_seeds(scenarios, seeds):
+    # Each scenario once per seed, so a small corpus can be widened into many runs
+    if seeds <= 1:
+        return scenarios
+    expanded = []
+    for scenario in scenarios:
+        for offset in range(seeds):
+            variant = copy.copy(scenario)
+            variant.seed = scenario.seed + offset
+            variant.name = f"{scenario.name}#{variant.seed}"
+            expanded.append(variant)
+    return expanded
+
+def run_diff(scenarios, base_rules, candidate_rules, workers=None, window=30, on_result=None):
+    # Both versions run each scenario in parallel; at most a few scenarios per worker are in
+    # flight, and each pair of change-point lists is dropped as soon as it has been diffed.
+    workers = max(2, workers or os.cpu_count() or 2)
+    context = mp.get_context("spawn")
+    base_pool = ProcessPoolExecutor(workers // 2, mp_context=context, initializer=load_rules, initargs=(base_rules,))
+    candidate_pool = ProcessPoolExecutor(workers - workers // 2, mp_context=context, initializer=load_rules, initargs=(candidate_rules,))
+    totals = {}
+    changed = 0
+    try:
+        for name, pool, path in (("base", base_pool, base_rules), ("candidate", candidate_pool, candidate_rules)):
+            error = pool.submit(check_rules).result()
+            if error:
+                raise ValueError(f"{name} rules {path} don't work with the current engine: {error}")
+
+        in_flight = deque()
+        queue = iter(scenarios)
+        while True:
+            while len(in_flight) < 4 * workers:
+                scenario = next(queue, None)
+                if scenario is None:
+                    break
+                in_flight.append((scenario, base_pool.submit(trace_scenario, scenario), candidate_pool.submit(trace_scenario, scenario)))
+            if not in_flight:
+                break
+
+            scenario, base, candidate = in_flight.popleft()
+            result = diff_timelines(scenario.name, base.result(), candidate.result(), scenario.frames, window)
+            for action, diff in result.actions.items():
+                totals.setdefault(action, ActionDiff()).merge(diff)
+            if result.changed:
+                changed += 1
+                if on_result:
+                    on_result(result)
+    finally:
+        base_pool.shutdown(cancel_futures=True)
+        candidate_pool.shutdown(cancel_futures=True)
+    return totals, changed
+
+def main():
+    parser = argparse.ArgumentParser(description="Diff compliance action timelines between two rule versions")
+    parser.add_argument("paths", nargs="+", help="scenario .json/.jsonl files")
+    parser.add_argument("--base", default="HEAD", help="baseline rules.py path or git revision (default: HEAD)")
+    parser.add_argument("--candidate", default="rules.py", help="candidate rules.py path or git revision")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--window", type=int, default=30, help="frames within which a shifted onset counts as delayed")
+    parser.add_argument("--seeds", type=int, default=1, help="run every scenario with this many consecutive seeds")
+    args = parser.parse_args()
+
+    from scenario import load_suite
+    try:
+        scenarios = expand_seeds(load_suite(args.paths), args.seeds)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Diffing {len(scenarios)} scenarios: {args.base} -> {args.candidate}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        try:
+            base_rules = resolve_rules(args.base, workdir)
+            candidate_rules = resolve_rules(args.candidate, workdir)
+            totals, changed = run_diff(scenarios, base_rules, candidate_rules, args.workers, args.window, on_result=print)
+        except ValueError as e:
+            raise SystemExit(f"rule_diff: {e}")
+
+    print(f"{changed} of {len(scenarios)} scenarios changed")
+    for action in sorted(totals):
+        if totals[action].changed:
+            print(f"    {action}: {totals[action]}")
+    if changed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
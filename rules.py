@@ -0,0 +1,74 @@
+from pyDatalog import pyDatalog
+import math
+
+# Traffic rules evaluated by ComplianceModule. They live apart from the engine in
+# compliance.py so that rule versions can be swapped and compared (see rule_diff.py).
+
+pyDatalog.create_terms(
+    """
+    math,
+    X, Y, Z, D, 
+    W,
+    ID,
+    D1, D2, D3, D4,
+    S1, S2, 
+    X1, X2, 
+    Y1, Y2,
+    Z1, Z2,
+    DX, DY,
+    traffic_signal, 
+    obstacle, 
+    collision,
+    ego_speed, 
+    ego_position,
+    speed_limit, 
+    action,
+    moving,
+    obstacle_within,
+    signal_within,
+    current_compliance_action,
+    distance,
+    lane_change,
+    weather
+    """)
+
+# Distance thresholds (px) used by the signal and obstacle rules
+SLOW_DISTANCE = 500
+BRAKE_DISTANCE = 200
+
+# Minimum time to intercept (frames) to the new leader and follower for a lane change
+MERGE_TIME = 60
+
+# Fact Definitions
+# Only these facts are read by the rules. obstacle, traffic_signal and ego_position feed the
+# range indexes and are never asserted, so the reasoner's work doesn't grow with them.
+RULE_FACTS = {'ego_speed', 'speed_limit', 'collision', 'weather', 'lane_change', 'obstacle_within', 'signal_within'}
+
+# Every action the rules below can produce
+ACTIONS = ('stop_collision', 'slow_signal', 'slow_limit', 'slow_obstacle', 'brake_signal', 'brake_obstacle', 'unsafe_merge', 'slow_weather')
+
+# Rule Definitions
+# Every fact and rule is keyed by a world id W so that several simulated worlds can be
+# evaluated in a single query. ComplianceModule adds W to the facts it asserts.
+moving(W) <= ego_speed(W, X) & (X > 0)
+
+# obstacle_within(D) and signal_within(State, D) are asserted from the range indexes in
+# ComplianceModule instead of joining every obstacle/signal against the ego position:
+#   obstacle_within(D)  <=> some obstacle has (X1 + S1) - (X2 + S2) < D
+#   signal_within(S, D) <=> some signal in state S has X1 - X2 < D
+action(W, 'stop_collision') <= collision(W, True)
+action(W, 'slow_signal') <= signal_within(W, 'yellow', SLOW_DISTANCE) & moving(W)
+action(W, 'slow_limit') <= ego_speed(W, X) & speed_limit(W, Y) & (X > Y)
+action(W, 'slow_obstacle') <= obstacle_within(W, SLOW_DISTANCE) & moving(W)
+action(W, 'brake_signal') <= signal_within(W, 'red', BRAKE_DISTANCE) & moving(W)
+action(W, 'brake_obstacle') <= obstacle_within(W, BRAKE_DISTANCE) & moving(W)
+
+# Lane changes that cut in front of a follower or close on a leader
+action(W, 'unsafe_merge') <= lane_change(W, S1, S2) & (S1 < MERGE_TIME)
+action(W, 'unsafe_merge') <= lane_change(W, S1, S2) & (S2 < MERGE_TIME)
+
+# New Rule for Weather Conditions
+action(W, 'slow_weather') <= weather(W, 'Rain')
+action(W, 'slow_weather') <= weather(W, 'Snow')
+
+current_compliance_action(W, X) <= action(W, X)
@@ -0,0 +1,181 @@
+import os
+import math
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from sim import Vehicle, IncidentType, CITY, HIGHWAY, headless_game, cruise
+
+# Two-sided z-scores for the supported confidence levels
+Z_SCORES = {
+    0.90: 1.645,
+    0.95: 1.960,
+    0.99: 2.576
+}
+
+class EpisodeConfig:
+    def __init__(self, vehicle_profile, sensor_profile, environment=CITY, frames=1800, cruise_speed=40):
+        self.vehicle_profile = vehicle_profile
+        self.sensor_profile = sensor_profile
+        self.environment = environment
+        self.frames = frames
+        self.cruise_speed = cruise_speed
+
+    @property
+    def key(self):
+        return (self.vehicle_profile, self.sensor_profile, self.environment)
+
+    def __str__(self):
+        return f"{self.vehicle_profile}/{self.sensor_profile}/{self.environment}"
+
+def run_episode(config: EpisodeConfig, seed: int):
+    game = headless_game(config.environment, seed)
+    game.car.set_profile(config.vehicle_profile)
+    game.car.set_sensor_profile(config.sensor_profile)
+
+    for _ in range(config.frames):
+        cruise(game, config.cruise_speed)
+        game.update()
+
+    return dict(game.car.incident_report.incident_counts)
+
+class RunningStats:
+    # Welford's online mean/variance, so episodes can be folded in as they finish
+    def __init__(self):
+        self.n = 0
+        self.total = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.n += 1
+        self.total += value
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else math.inf
+
+    def interval(self, z):
+        # Score interval for a Poisson rate: it stays open when few or no incidents were seen
+        # (about 3.8/n wide at 95% for zero, like the rule of three), where the normal interval
+        # would collapse to [0, 0]. It is widened to the normal interval when episodes are
+        # more spread out than Poisson.
+        if self.n < 2:
+            return 0.0, math.inf
+        centre = (self.total + z * z / 2) / self.n
+        spread = z * math.sqrt(self.total + z * z / 4) / self.n
+        h = z * math.sqrt(self.variance / self.n)
+        return max(0.0, min(centre - spread, self.mean - h)), max(centre + spread, self.mean + h)
+
+    def half_width(self, z):
+        low, high = self.interval(z)
+        return (high - low) / 2
+
+class ConfigEstimator:
+    def __init__(self, config: EpisodeConfig):
+        self.config = config
+        self.stats = {incident_type: RunningStats() for incident_type in IncidentType}
+        self.in_flight = 0
+        self.done = False
+
+    @property
+    def episodes(self):
+        return self.stats[IncidentType.Collision].n
+
+    def add(self, counts):
+        for incident_type, count in counts.items():
+            self.stats[incident_type].add(count)
+
+    def widest_interval(self, z):
+        return max(s.half_width(z) for s in self.stats.values())
+
+    def interval(self, incident_type, z):
+        return self.stats[incident_type].interval(z)
+
+class SafetyStatistics:
+    # Runs episodes for every configuration across worker processes and stops each
+    # configuration once all of its incident-rate intervals are narrower than the target.
+    def __init__(self, configs, target_half_width=0.05, confidence=0.95, min_episodes=10, max_episodes=1000, workers=None, seed=0):
+        self.estimators = [ConfigEstimator(c) for c in configs]
+        self.target_half_width = target_half_width
+        self.z = Z_SCORES[confidence]
+        self.confidence = confidence
+        self.min_episodes = min_episodes
+        self.max_episodes = max_episodes
+        self.workers = workers or os.cpu_count()
+        self.seeds = itertools.count(seed)
+
+    def is_converged(self, estimator):
+        if estimator.episodes < self.min_episodes:
+            return False
+        return estimator.episodes >= self.max_episodes or estimator.widest_interval(self.z) <= self.target_half_width
+
+    def next_estimator(self):
+        # Spend the next episode on the least certain configuration that is still running
+        active = [e for e in self.estimators if not e.done and e.episodes + e.in_flight < self.max_episodes]
+        if not active:
+            return None
+        return max(active, key=lambda e: (e.widest_interval(self.z), -(e.episodes + e.in_flight)))
+
+    def run(self, on_result=None):
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            pending = {}
+            while True:
+                while len(pending) < self.workers * 2:
+                    estimator = self.next_estimator()
+                    if estimator is None:
+                        break
+                    estimator.in_flight += 1
+                    pending[pool.submit(run_episode, estimator.config, next(self.seeds))] = estimator
+
+                if not pending:
+                    break
+
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    estimator = pending.pop(future)
+                    estimator.in_flight -= 1
+                    if estimator.done:
+                        continue
+                    estimator.add(future.result())
+                    if self.is_converged(estimator):
+                        estimator.done = True
+                    if on_result:
+                        on_result(estimator)
+
+        return self.estimators
+
+    def print_report(self):
+        print(f"Safety Statistics ({int(self.confidence * 100)}% intervals, incidents per episode):")
+        for estimator in self.estimators:
+            print(f"{estimator.config} - {estimator.episodes} episodes")
+            for incident_type in IncidentType:
+                low, high = estimator.interval(incident_type, self.z)
+                print(f"    {incident_type.name}: {estimator.stats[incident_type].mean:.3f} [{low:.3f}, {high:.3f}]")
+
+def main():
+    parser = argparse.ArgumentParser(description="Estimate incident rates per vehicle/sensor profile")
+    parser.add_argument("--environment", choices=[CITY, HIGHWAY], default=CITY)
+    parser.add_argument("--frames", type=int, default=1800)
+    parser.add_argument("--target", type=float, default=0.05, help="confidence interval half-width to stop at")
+    parser.add_argument("--confidence", type=float, choices=sorted(Z_SCORES), default=0.95)
+    parser.add_argument("--min-episodes", type=int, default=10)
+    parser.add_argument("--max-episodes", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    configs = [
+        EpisodeConfig(vehicle_profile, sensor_profile, args.environment, args.frames)
+        for vehicle_profile in Vehicle.vehicle_profiles
+        for sensor_profile in Vehicle.sensor_profiles
+    ]
+    stats = SafetyStatistics(configs, args.target, args.confidence, args.min_episodes, args.max_episodes, args.workers, args.seed)
+    stats.run(on_result=lambda e: print(f"{e.config}: {e.episodes} episodes{' (done)' if e.done else ''}"))
+    stats.print_report()
+
+if __name__ == "__main__":
+    main()
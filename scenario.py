@@ -0,0 +1,272 @@
+import os
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pygame
+from rules import ACTIONS
+from sim import Vehicle, TrafficLight, Weather, CITY, HIGHWAY, headless_game
+
+# Scenario files are JSON: either one scenario object, a list of them, or JSON Lines
+# with one scenario per line. Example:
+#
+# {
+#     "name": "red_light_approach",
+#     "environment": "city",
+#     "speed_limit": 30,
+#     "frames": 600,
+#     "seed": 1,
+#     "vehicle_profile": "sedan",
+#     "sensor_profile": "perfect",
+#     "weather": [[0, "Clear"], [300, "Rain"]],
+#     "traffic": [{"profile": "delivery_truck", "x": 900, "lane": 0, "speed": 15}],
+#     "traffic_lights": [{"x": 2400, "state": "red", "timer": 200, "durations": {"red": 200, "yellow": 100, "green": 200}}],
+#     "inputs": [[0, ["right"]], [240, []]],
+#     "expect": [[310, ["slow_weather"]]]
+# }
+#
+# weather and inputs are change points: each entry holds until the next one. expect lists
+# the exact compliance action set at a frame, with [] meaning no action.
+
+KEYS = {
+    "left": pygame.K_LEFT,
+    "right": pygame.K_RIGHT,
+    "up": pygame.K_UP,
+    "down": pygame.K_DOWN
+}
+LANES = [-1, 0, 1]
+
+class CompiledScenario:
+    def __init__(self, name, environment, speed_limit, frames, seed, vehicle_profile, sensor_profile, weather, traffic, traffic_lights, inputs, expected):
+        self.name = name
+        self.environment = environment
+        self.speed_limit = speed_limit
+        self.frames = frames
+        self.seed = seed
+        self.vehicle_profile = vehicle_profile
+        self.sensor_profile = sensor_profile
+        self.weather = weather                # ((frame, Weather), ...) sorted by frame
+        self.traffic = traffic                # ((profile, x, lane, speed), ...)
+        self.traffic_lights = traffic_lights  # ((x, state, timer, durations), ...)
+        self.inputs = inputs                  # ((frame, (left, right, up, down)), ...) sorted by frame
+        self.expected = expected              # {frame: frozenset(actions)}
+
+class ScenarioResult:
+    def __init__(self, name, mismatches, incident_counts):
+        self.name = name
+        self.mismatches = mismatches
+        self.incident_counts = incident_counts
+
+    @property
+    def passed(self):
+        return not self.mismatches
+
+    def __str__(self):
+        status = "PASS" if self.passed else "FAIL"
+        incidents = ", ".join(f"{t.name}={c}" for t, c in self.incident_counts.items() if c)
+        lines = [f"{status} {self.name}" + (f" ({incidents})" if incidents else "")]
+        for frame, expected, actual in self.mismatches:
+            lines.append(f"    frame {frame}: expected {sorted(expected)}, got {sorted(actual)}")
+        return "\n".join(lines)
+
+def _require(condition, name, message):
+    if not condition:
+        raise ValueError(f"Scenario '{name}': {message}")
+
+def _is_int(value):
+    # bool is a subclass of int, but true/false is never a frame count or position
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _schedule(entries, name, field, frames, convert):
+    _require(isinstance(entries, list), name, f"{field} must be a list of [frame, value] pairs")
+    schedule = []
+    for entry in entries:
+        _require(isinstance(entry, list) and len(entry) == 2 and _is_int(entry[0]), name, f"bad {field} entry {entry!r}")
+        _require(0 <= entry[0] < frames, name, f"{field} frame {entry[0]} outside 0..{frames - 1}")
+        schedule.append((entry[0], convert(entry[1])))
+    schedule.sort(key=lambda e: e[0])
+    return tuple(schedule)
+
+def compile_scenario(data):
+    _require(isinstance(data, dict), "?", "scenario must be an object")
+    name = data.get("name")
+    _require(isinstance(name, str) and name, "?", "missing name")
+
+    environment = data.get("environment", CITY)
+    _require(environment in (CITY, HIGHWAY), name, f"unknown environment {environment!r}")
+    speed_limit = data.get("speed_limit", 30)
+    _require(_is_number(speed_limit) and speed_limit > 0, name, "speed_limit must be positive")
+    frames = data.get("frames", 600)
+    _require(_is_int(frames) and frames > 0, name, "frames must be a positive integer")
+    seed = data.get("seed", 0)
+    _require(_is_int(seed), name, "seed must be an integer")
+    vehicle_profile = data.get("vehicle_profile", "sedan")
+    _require(vehicle_profile in Vehicle.vehicle_profiles, name, f"unknown vehicle profile {vehicle_profile!r}")
+    sensor_profile = data.get("sensor_profile", "perfect")
+    _require(sensor_profile in Vehicle.sensor_profiles, name, f"unknown sensor profile {sensor_profile!r}")
+
+    def weather(value):
+        _require(value in Weather.__members__, name, f"unknown weather {value!r}")
+        return Weather[value]
+    weather_schedule = _schedule(data.get("weather", []), name, "weather", frames, weather)
+
+    def keys(value):
+        _require(isinstance(value, list) and all(k in KEYS for k in value), name, f"inputs must be lists of {sorted(KEYS)}")
+        return tuple(k in value for k in KEYS)
+    inputs = _schedule(data.get("inputs", []), name, "inputs", frames, keys)
+
+    def actions(value):
+        _require(isinstance(value, list) and all(isinstance(a, str) for a in value), name, "expected actions must be a list of names")
+        unknown = sorted(set(value) - set(ACTIONS))
+        _require(not unknown, name, f"unknown actions {unknown}, expected any of {list(ACTIONS)}")
+        return frozenset(value)
+    expect_schedule = _schedule(data.get("expect", []), name, "expect", frames, actions)
+    expected = dict(expect_schedule)
+    duplicates = sorted({a[0] for a, b in zip(expect_schedule, expect_schedule[1:]) if a[0] == b[0]})
+    _require(not duplicates, name, f"expect lists frames {duplicates} more than once")
+
+    traffic = []
+    _require(isinstance(data.get("traffic", []), list), name, "traffic must be a list")
+    for vehicle in data.get("traffic", []):
+        _require(isinstance(vehicle, dict), name, f"traffic entry {vehicle!r} must be an object")
+        profile = vehicle.get("profile", "sedan")
+        _require(profile in Vehicle.vehicle_profiles, name, f"unknown traffic profile {profile!r}")
+        _require(_is_number(vehicle.get("x")), name, "traffic x is required")
+        lane = vehicle.get("lane", 0)
+        _require(_is_int(lane) and lane in LANES, name, f"traffic lane must be one of {LANES}")
+        speed = vehicle.get("speed", speed_limit)
+        _require(_is_number(speed) and speed >= 0, name, "traffic speed must be non-negative")
+        traffic.append((profile, vehicle["x"], lane, speed))
+
+    lights = []
+    _require(isinstance(data.get("traffic_lights", []), list), name, "traffic_lights must be a list")
+    for light in data.get("traffic_lights", []):
+        _require(isinstance(light, dict), name, f"traffic light entry {light!r} must be an object")
+        _require(environment == CITY, name, "traffic lights are only simulated in the city")
+        _require(_is_number(light.get("x")), name, "traffic light x is required")
+        state = light.get("state", "green")
+        _require(state in TrafficLight.next_state, name, f"unknown light state {state!r}")
+        _require(isinstance(light.get("durations", {}), dict), name, "light durations must be an object")
+        durations = dict(TrafficLight.default_durations, **light.get("durations", {}))
+        _require(set(durations) == set(TrafficLight.default_durations) and all(_is_int(d) and d > 0 for d in durations.values()), name, "light durations must be positive frame counts per state")
+        timer = light.get("timer", durations[state])
+        _require(_is_int(timer) and timer > 0, name, "light timer must be a positive frame count")
+        lights.append((light["x"], state, timer, durations))
+
+    return CompiledScenario(name, environment, speed_limit, frames, seed, vehicle_profile, sensor_profile,
+                            weather_schedule, tuple(traffic), tuple(lights), inputs, expected)
+
+def load_scenarios(path):
+    with open(path) as f:
+        text = f.read()
+    stripped = text.lstrip()
+    if stripped.startswith("["):
+        documents = json.loads(text)
+    elif path.endswith(".jsonl"):
+        documents = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        documents = [json.loads(text)]
+
+    scenarios = [compile_scenario(d) for d in documents]
+    names = set()
+    for scenario in scenarios:
+        _require(scenario.name not in names, scenario.name, "duplicate scenario name")
+        names.add(scenario.name)
+    return scenarios
+
+def load_suite(paths):
+    # Names the offending file, so the command line tools can report it as a usage error
+    scenarios = []
+    for path in paths:
+        try:
+            scenarios.extend(load_scenarios(path))
+        except (OSError, ValueError) as e:
+            raise ValueError(f"{path}: {e}") from e
+    return scenarios
+
+def build_game(scenario: CompiledScenario):
+    game = headless_game(scenario.environment, scenario.seed, speed_limit=scenario.speed_limit)
+    env = game.env
+    game.car.set_profile(scenario.vehicle_profile)
+    game.car.set_sensor_profile(scenario.sensor_profile)
+
+    # Replace the random setup with the scripted traffic and lights, which stay put once passed
+    env.scripted = True
+    env.vehicles[:] = [game.car]
+    env.traffic_lights.clear()
+    for profile, x, lane, speed in scenario.traffic:
+        vehicle = Vehicle(game)
+        vehicle.place(game, x, lane, profile, 1.0)
+        vehicle.desired_speed = vehicle.speed = min(speed, vehicle.max_speed)
+        env.vehicles.append(vehicle)
+    for x, state, timer, durations in scenario.traffic_lights:
+        light = TrafficLight(game)
+        light.durations = durations
+        light.place(x, state, timer)
+        env.traffic_lights.append(light)
+    return game
+
+def play_scenario(scenario: CompiledScenario):
+    # Yields (frame, game) after every simulated frame
+    game = build_game(scenario)
+    keys = game.keys
+    weather_index = 0
+    input_index = 0
+
+    for frame in range(scenario.frames):
+        while weather_index < len(scenario.weather) and scenario.weather[weather_index][0] <= frame:
+            game.weather = scenario.weather[weather_index][1]
+            weather_index += 1
+        while input_index < len(scenario.inputs) and scenario.inputs[input_index][0] <= frame:
+            for key, pressed in zip(KEYS.values(), scenario.inputs[input_index][1]):
+                keys[key] = pressed
+            input_index += 1
+
+        game.update()
+        yield frame, game
+
+def run_scenario(scenario: CompiledScenario):
+    mismatches = []
+    for frame, game in play_scenario(scenario):
+        expected = scenario.expected.get(frame)
+        if expected is not None:
+            actual = frozenset(a for a in game.compliance_actions if a != 'None')
+            if actual != expected:
+                mismatches.append((frame, expected, actual))
+
+    return ScenarioResult(scenario.name, mismatches, dict(game.car.incident_report.incident_counts))
+
+def run_suite(scenarios, workers=None):
+    if workers == 1:
+        return [run_scenario(s) for s in scenarios]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_scenario, scenarios, chunksize=max(1, len(scenarios) // (4 * (workers or os.cpu_count())))))
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate and run scenario suites through the headless simulator")
+    parser.add_argument("paths", nargs="+", help="scenario .json/.jsonl files")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--check", action="store_true", help="only validate and compile the scenarios")
+    args = parser.parse_args()
+
+    try:
+        scenarios = load_suite(args.paths)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Loaded {len(scenarios)} scenarios")
+    if args.check:
+        return
+
+    results = run_suite(scenarios, args.workers)
+    for result in results:
+        print(result)
+    failed = sum(not r.passed for r in results)
+    print(f"{len(results) - failed} passed, {failed} failed")
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,19 @@
-import pygame
+import os
 import sys
+
+# Tools that import the simulator run it without a window
+if __name__ != "__main__":
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
 import math
+from collections import deque
+import argparse
+import bisect
 import random
+import numpy as np
 from compliance import ComplianceModule
+from recorder import FrameRecorder, PNG, RAW, DEFAULT_MEMORY_BUDGET
 from enum import Enum
 
 pygame.init()
@@ -13,6 +24,12 @@ ROAD_MIDDLE = HEIGHT // 2
 ROAD_TOP = HEIGHT // 2 - ROAD_MIDDLE // 2
 ROAD_BOTTOM = HEIGHT // 2 + ROAD_MIDDLE // 2
 CAR_SCREEN_POSITION = WIDTH // 6
+CHUNK_LENGTH = WIDTH
+CHUNKS_AHEAD = 3
+CHUNKS_BEHIND = 1
+LANES = [-1, 0, 1]
+TRAFFIC_PER_CHUNK = 1.5
+TRAFFIC_SPEED = (0.75, 1.2)  # Range of traffic speeds as a fraction of the speed limit
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("Automated Test Dummies! 0.0.1")
 
@@ -57,12 +74,19 @@ class Incident:
         return f"{self.incident_time}: {self.incident_type} - {self.data}"
 
 class IncidentReport:
-    def __init__(self):
-        self.event_log = []
+    def __init__(self, verbose=True, max_events=1000):
+        # Only the most recent events are kept; incident_counts covers the whole run
+        self.event_log = deque(maxlen=max_events)
+        self.incident_counts = {incident_type: 0 for incident_type in IncidentType}
+        self.total_incidents = 0
+        self.verbose = verbose
 
     def add_incident(self, incident: Incident):
         self.event_log.append(str(incident))
-        print(incident)
+        self.incident_counts[incident.incident_type] += 1
+        self.total_incidents += 1
+        if self.verbose:
+            print(incident)
 
     def print_report(self):
         print("Incident Report:")
@@ -71,13 +95,21 @@ class IncidentReport:
 
 class GameObject:
     _current_object_id = 0
+    _free_ids = deque()
     def __init__(self, x=0, y=0, w=10, h=10):
         self.bounds = pygame.Rect(x, y, w, h)        
         self.init_id()
 
     def init_id(self):
-        self.id = GameObject._current_object_id
-        GameObject._current_object_id += 1
+        # Ids of discarded objects are reused oldest-first so the id space stays bounded
+        if GameObject._free_ids:
+            self.id = GameObject._free_ids.popleft()
+        else:
+            self.id = GameObject._current_object_id
+            GameObject._current_object_id += 1
+
+    def release_id(self):
+        GameObject._free_ids.append(self.id)
 
     @property
     def x(self):
@@ -111,32 +143,36 @@ class GameObject:
     def height(self, nh):
         self.bounds.height = nh
 
+    def get_collision_bounds(self):
+        return self.bounds
+
     def collide(self, other_obj):
         return self.bounds.colliderect(other_obj.bounds)
 
 class TrafficLight(GameObject):
+    next_state = {"red": "green", "yellow": "red", "green": "yellow"}
+    default_durations = {"red": 200, "yellow": 100, "green": 200}
+
     def __init__(self, game):
         super().__init__(0, ROAD_TOP, 10, ROAD_BOTTOM - ROAD_TOP)
+        self.durations = TrafficLight.default_durations
         self.reset(game)
 
     def reset(self, game):
-        self.state = random.choice(["red", "yellow", "green"])
-        self.timer = random.randint(100, 200)
-        self.x = random.randint(2, 5) * WIDTH + game.car.x
+        rng = game.rng
+        self.place(rng.randint(2, 5) * WIDTH + game.car.x, rng.choice(["red", "yellow", "green"]), rng.randint(100, 200))
+
+    def place(self, x, state, timer):
+        self.state = state
+        self.timer = timer
+        self.x = x
         self.flashed = False
 
     def update(self, game):
         self.timer -= 1
         if self.timer <= 0:
-            if self.state == "red":
-                self.state = "green"
-                self.timer = 200
-            elif self.state == "yellow":
-                self.state = "red"
-                self.timer = 200
-            elif self.state == "green":
-                self.state = "yellow"
-                self.timer = 100
+            self.state = TrafficLight.next_state[self.state]
+            self.timer = self.durations[self.state]
         
         # Add collision check and flash effect for red light violations
         if not self.flashed and self.collide(game.car) and self.state == "red":
@@ -145,7 +181,9 @@ class TrafficLight(GameObject):
             incident_data = {'traffic_light_id': self.id, 'traffic_light_x': self.x}
             game.car.handle_incident(game, IncidentType.TrafficLightViolation, incident_data)
 
-        if game.get_screen_x(self.x) < -50:
+        # Streamed worlds evict lights with their chunk and scripted worlds keep theirs instead of recycling them
+        env = game.get_current_env()
+        if game.get_screen_x(self.x) < -50 and not env.world and not env.scripted:
             self.reset(game)
 
     def draw(self, game):
@@ -192,17 +230,17 @@ class Tree(GameObject):
         self.size = size
 
 class Building(GameObject):
-    def __init__(self, x, y, width, height):
+    def __init__(self, x, y, width, height, rng=random):
         super().__init__(x, y, width, height)
         self.windows = []
-        self.generate_windows()
+        self.generate_windows(rng)
 
-    def generate_windows(self):
+    def generate_windows(self, rng=random):
         window_rows = self.height // 30
         window_cols = self.width // 30
         for row in range(window_rows):
             for col in range(window_cols):
-                if random.random() > 0.3:  # 70% chance of window
+                if rng.random() > 0.3:  # 70% chance of window
                     self.windows.append((
                         self.x + col * 30 + 5,
                         self.y + row * 30 + 5,
@@ -256,24 +294,28 @@ class Vehicle(GameObject):
             'light_detection': 1.0,
             'obstacle_detection': 1.0,
             'speed_accuracy': 1.0,
+            'false_positive': 0.0,
         },
         'speedy':
         {
             'light_detection': 0.9,
             'obstacle_detection': 0.85,
             'speed_accuracy': 0.6,
+            'false_positive': 0.002,
         },
         'smashy':
         {
             'light_detection': 0.9,
             'obstacle_detection': 0.5,
             'speed_accuracy': 0.85,
+            'false_positive': 0.005,
         },
         'clumsy':
         {
             'light_detection': 0.6,
             'obstacle_detection': 0.8,
             'speed_accuracy': 0.9,
+            'false_positive': 0.003,
         }
     }
 
@@ -282,15 +324,24 @@ class Vehicle(GameObject):
         self.reset(game)
 
     def reset(self, game):
+        # Take the new id before freeing the old one so a respawn never keeps its id
+        old_id = self.id
         self.init_id()
+        GameObject._free_ids.append(old_id)
+        rng = game.rng
+        spawn_side = rng.choice([-1, 0, 1])
+        spawn_x = rng.randint(1, 2) * WIDTH + game.car.x
+        vehicle_type = rng.choice(['sedan', 'sports_car', 'delivery_truck'])
+        self.place(game, spawn_x, spawn_side, vehicle_type, rng.randrange(75, 120)/100)
+
+    def place(self, game, spawn_x, spawn_side, vehicle_type, speed_factor):
         road_height = HEIGHT // 2
-        spawn_side = random.choice([-1, 0, 1])
-        spawn_x = random.randint(1, 2) * WIDTH + game.car.x
         spawn_y = HEIGHT // 2 + spawn_side * road_height // 3
-        self.type = random.choice(['sedan', 'sports_car', 'delivery_truck'])
+        self.type = vehicle_type
         self.set_profile(self.type)
+        self.set_sensor_profile('perfect')
         self.bounds = pygame.Rect(spawn_x, spawn_y, Vehicle.vehicle_profiles[self.type]['width'], Vehicle.vehicle_profiles[self.type]['height']) 
-        self.desired_speed = min((random.randrange(75, 120)/100) * game.env.speed_limit, self.max_speed)
+        self.desired_speed = min(speed_factor * game.env.speed_limit, self.max_speed)
         self.speed = self.desired_speed
         self.stopped = False
         self.crashed = False
@@ -307,6 +358,17 @@ class Vehicle(GameObject):
         self.brake_decel = profile['brake_decel']
         self.vertical_speed = profile['vertical_speed']
 
+    def set_sensor_profile(self, profile_name):
+        profile = Vehicle.sensor_profiles[profile_name]
+        self.sensor_profile_name = profile_name
+        self.light_detection = profile['light_detection']
+        self.obstacle_detection = profile['obstacle_detection']
+        self.speed_accuracy = profile['speed_accuracy']
+        self.false_positive = profile['false_positive']
+
+    def get_sensor_speed(self, game):
+        return game.sensors.speed_reading(self)
+
     def calculate_accel(self, desired_speed, dt):
         dv = desired_speed - self.speed
         a = dv / min(20, max(1, dt))
@@ -320,34 +382,31 @@ class Vehicle(GameObject):
         return pygame.Rect(self.x, self.y, Vehicle.obstacle_detection_range, self.height)
 
     def update_sensors(self, game, target_speed):
-        vehicle_sensor = self.get_sensor_rect()
+        detections = game.sensors.detected(self)
         target_position = self.x + self.width * 2
         time_to_intercept = 100000
         target_object = None
-        for vehicle in game.get_current_env().vehicles:
-            if vehicle != self:
-                if vehicle_sensor.colliderect(vehicle.get_collision_bounds()) and (not vehicle.crashed or self == game.car):
-                    tti = Vehicle.calc_time_to_intercept(target_position, vehicle.x, self.speed, vehicle.speed)
-                    if tti < time_to_intercept:
-                        time_to_intercept = tti
-                        target_speed = vehicle.speed
-                        target_object = vehicle
-
-        for light in game.get_current_env().traffic_lights:
-            if vehicle_sensor.colliderect(light.get_collision_bounds()) and (light.state == "red"):
+        for vehicle in detections.vehicles:
+            tti = Vehicle.calc_time_to_intercept(target_position, vehicle.x, self.speed, vehicle.speed)
+            if tti < time_to_intercept:
+                time_to_intercept = tti
+                target_speed = vehicle.speed
+                target_object = vehicle
+
+        for light in detections.traffic_lights:
+            if light.state == "red":
                 tti = Vehicle.calc_time_to_intercept(target_position, light.x, self.speed, 0)
                 if tti < time_to_intercept:
                     time_to_intercept = tti
                     target_speed = 0
                     target_object = light
 
-        for pedestrian in game.get_current_env().pedestrians:
-            if vehicle_sensor.colliderect(pedestrian.get_collision_bounds()) and (not pedestrian.crashed or self == game.car):
-                tti = Vehicle.calc_time_to_intercept(target_position, pedestrian.x, self.speed, 0)
-                if tti < time_to_intercept:
-                    time_to_intercept = tti
-                    target_speed = 0
-                    target_object = pedestrian
+        for pedestrian in detections.pedestrians:
+            tti = Vehicle.calc_time_to_intercept(target_position, pedestrian.x, self.speed, 0)
+            if tti < time_to_intercept:
+                time_to_intercept = tti
+                target_speed = 0
+                target_object = pedestrian
 
         target_accel = self.calculate_accel(target_speed, time_to_intercept)
         return target_speed, target_accel, time_to_intercept, target_object
@@ -376,7 +435,7 @@ class Vehicle(GameObject):
         self.braking = (self.speed - cur_speed) < 0
 
         screen_x = game.get_screen_x(self.x)
-        if screen_x < -WIDTH * 3 or screen_x > WIDTH * 3:
+        if (screen_x < -WIDTH * 3 or screen_x > WIDTH * 3) and not game.get_current_env().scripted:
             self.reset(game)
 
     def draw(self, game):
@@ -428,28 +487,22 @@ class PlayerVehicle(Vehicle):
         self.crashed = False
         self.throttle = Vehicle.ThrottleCommand.Coast
         self.braking = False
-
-    def get_sensor_speed(self):
-        speed_range = self.speed * (1 - self.speed_accuracy) 
-        return self.speed - speed_range + random.random() * 2 * speed_range
-
-    def set_sensor_profile(self, profile_name):
-        profile = Vehicle.sensor_profiles[profile_name]
-        self.sensor_profile_name = profile_name
-        self.light_detection = profile['light_detection']
-        self.obstacle_detection = profile['obstacle_detection']
-        self.speed_accuracy = profile['speed_accuracy']
+        self.controller = SpeedController()
 
     def handle_incident(self, game, incident_type: IncidentType, incident_data: dict):
         super().handle_incident(game, incident_type, incident_data)
+        if incident_type == IncidentType.Collision:
+            game.collisions.append(game.game_frame)
         self.incident_report.add_incident(Incident(game.game_frame, incident_type, incident_data))
 
     def update(self, game):
-        # Adjust desired_speed based on compliance actions**
-        if game.enforce_compliance and 'slow_weather' in game.compliance_actions:
-            self.desired_speed = 10  # Enforce a maximum speed of 10 mph in adverse weather
-        else:
-            self.desired_speed = self.speed
+        target_speed, target_accel, time_to_intercept, target_object = self.update_sensors(game, self.desired_speed)
+        if isinstance(target_object, (Vehicle, PhantomObstacle)):
+            ComplianceModule.add_fact('obstacle', target_object.id, target_object.speed, target_object.x, target_object.y)
+        elif  isinstance(target_object, TrafficLight):
+            ComplianceModule.add_fact('traffic_signal', target_object.id, target_object.x, target_object.state)
+
+        self.desired_speed = self.speed
 
         # Handle user inputs to adjust desired_speed**
         if game.keys[pygame.K_LEFT]:
@@ -457,6 +510,12 @@ class PlayerVehicle(Vehicle):
         elif game.keys[pygame.K_RIGHT]:
             self.desired_speed = min(self.max_speed, self.desired_speed + self.acceleration)  # Increase desired_speed
 
+        # Cap desired_speed with the speed profile planned from the compliance actions**
+        if game.enforce_compliance:
+            speed_cap = self.controller.speed_cap(game, self)
+            if speed_cap is not None:
+                self.desired_speed = min(self.desired_speed, speed_cap)
+
         # Handle vertical movement (lane changing)**
         target_y = self.y
         if game.keys[pygame.K_UP]:
@@ -468,16 +527,12 @@ class PlayerVehicle(Vehicle):
             self.y = min(self.y + self.vertical_speed, target_y)
         elif self.y > target_y:
             self.y = max(self.y - self.vertical_speed, target_y)
-            
-        target_speed, target_accel, time_to_intercept, target_object = self.update_sensors(game, target_speed)
-        if isinstance(target_object, Vehicle):
-            ComplianceModule.add_fact('obstacle', target_object.id, target_object.speed, target_object.x, target_object.y)
-        elif  isinstance(target_object, TrafficLight):
-            ComplianceModule.add_fact('traffic_signal', target_object.id, target_object.x, target_object.state)
 
         #Determine throttle based on desired_speed**
         if self.speed < self.desired_speed:
             self.throttle = Vehicle.ThrottleCommand.Accel
+        elif self.speed - self.desired_speed > self.deceleration:
+            self.throttle = Vehicle.ThrottleCommand.Brake  # Coasting alone cannot slow down fast enough
         elif self.speed > self.desired_speed:
             self.throttle = Vehicle.ThrottleCommand.Coast
         else:
@@ -489,14 +544,492 @@ class PlayerVehicle(Vehicle):
                 # Prevent speed from dropping below desired_speed
                 self.speed = max(self.desired_speed, self.speed - self.deceleration)                
             case Vehicle.ThrottleCommand.Accel:
-                self.speed = min(self.speed + self.acceleration, self.max_speed)
+                # Never past desired_speed, or a speed cap just above the current speed is overshot
+                self.speed = min(self.speed + self.acceleration, self.max_speed, self.desired_speed)
             case Vehicle.ThrottleCommand.Brake:
-                self.speed = max(self.speed - self.brake_decel, 0)
-                self.braking = True
+                # Brakes act on top of rolling drag, the same full deceleration the controller plans with
+                self.speed = max(self.speed - (self.deceleration + self.brake_decel), self.desired_speed, 0)
+        self.braking = self.throttle == Vehicle.ThrottleCommand.Brake
 
         # **7. Update position based on speed**
         self.x += self.speed
 
+class SpeedController:
+    # Turns the compliance action set into a speed profile planned once from the distance to
+    # the object being reacted to and the vehicle's braking. It is only re-planned when the
+    # actions or that object change, so following it is one lookup per frame. A detected red
+    # light or obstacle is planned for as soon as it is seen rather than when
+    # brake_signal/brake_obstacle fire, since stopping from speed takes far longer than
+    # BRAKE_DISTANCE. A yellow light is stopped for whenever the car can still stop before it.
+    # The car is also held to a speed it can stop from within its sensor range, so anything
+    # it detects can still be stopped for. Lights and obstacles are picked as the nearest
+    # detected one ahead rather than by time to intercept, which gives up on an obstacle as
+    # soon as the car stops behind it. An obstacle stays in the plan through a few frames of
+    # sensor dropout, so a noisy sensor doesn't keep letting go of the brakes.
+    weather_speed = 10
+    stop_margin = 10
+    track_frames = 10
+
+    def __init__(self):
+        self.plan_key = None
+        self.profile = []
+        self.step = 0
+        self.tracked = None
+        self.tracked_id = None
+        self.missed = 0
+
+    @staticmethod
+    def ramp(start_speed, target_speed, decel):
+        if start_speed <= target_speed:
+            return [target_speed]
+        steps = math.ceil((start_speed - target_speed) / decel)
+        return [max(target_speed, start_speed - decel * (k + 1)) for k in range(steps)]
+
+    @staticmethod
+    def stop_decel(vehicle, stop_x):
+        # Constant deceleration that stops the car before its front reaches stop_x
+        max_decel = vehicle.deceleration + vehicle.brake_decel
+        distance = stop_x - (vehicle.x + vehicle.width) - SpeedController.stop_margin
+        if distance <= 0:
+            return max_decel
+        return min(max_decel, max(vehicle.deceleration / 4, vehicle.speed * vehicle.speed / (2 * distance)))
+
+    @staticmethod
+    def stopping_speed(vehicle, distance):
+        # Highest v whose stopping distance v^2/2a, plus one frame of travel, fits in distance
+        max_decel = vehicle.deceleration + vehicle.brake_decel
+        if distance <= 0:
+            return 0
+        return max_decel * (math.sqrt(1 + 2 * distance / max_decel) - 1)
+
+    @staticmethod
+    def sight_speed(vehicle, detection_range):
+        # Anything is seen one frame before it enters the range, so stop within what is left of it
+        return SpeedController.stopping_speed(vehicle, detection_range - vehicle.width - SpeedController.stop_margin)
+
+    @staticmethod
+    def approach(vehicle, gap, object_speed):
+        # Caps for closing on an object gap px ahead moving at object_speed. Each frame the car
+        # may go no faster than it could still stop from in what is left of the gap, assuming
+        # it speeds up or brakes towards that cap, until the cap is down to the object's speed
+        # and the car just follows it. Positions are whole pixels, so within a margin of the
+        # object the cap is its speed rather than a sub-pixel creep.
+        max_decel = vehicle.deceleration + vehicle.brake_decel
+        profile = []
+        speed = vehicle.speed
+        while True:
+            cap = SpeedController.stopping_speed(vehicle, gap) if gap > SpeedController.stop_margin else 0
+            if cap <= object_speed + vehicle.deceleration:
+                break
+            profile.append(cap)
+            speed = max(speed - max_decel, min(cap, speed + vehicle.acceleration))
+            gap -= speed - object_speed
+        profile.append(object_speed)
+        return profile
+
+    @staticmethod
+    def nearest_light(game, vehicle, state):
+        lights = [l for l in game.sensors.detected(vehicle).traffic_lights if l.state == state and l.x > vehicle.x]
+        return min(lights, key=lambda l: l.x) if lights else None
+
+    @staticmethod
+    def nearest_obstacle(game, vehicle):
+        detections = game.sensors.detected(vehicle)
+        obstacles = [o for o in detections.vehicles + detections.pedestrians if o.x > vehicle.x]
+        return min(obstacles, key=lambda o: o.x) if obstacles else None
+
+    def plan(self, game, vehicle, actions, obstacle, red_light, yellow_light):
+        max_decel = vehicle.deceleration + vehicle.brake_decel
+        ramps = []
+        if 'stop_collision' in actions:
+            ramps.append(SpeedController.ramp(vehicle.speed, 0, max_decel))
+
+        detection_range = Vehicle.obstacle_detection_range
+        if game.get_current_env().traffic_lights:
+            detection_range = min(detection_range, Vehicle.light_detection_range)
+        ramps.append(SpeedController.ramp(vehicle.speed, SpeedController.sight_speed(vehicle, detection_range), vehicle.deceleration))
+
+        if red_light:
+            ramps.append(SpeedController.ramp(vehicle.speed, 0, SpeedController.stop_decel(vehicle, red_light.x)))
+
+        if yellow_light:
+            decel = SpeedController.stop_decel(vehicle, yellow_light.x)
+            if decel < max_decel:
+                ramps.append(SpeedController.ramp(vehicle.speed, 0, decel))
+
+        if 'brake_signal' in actions and not red_light:
+            ramps.append(SpeedController.ramp(vehicle.speed, 0, max_decel))
+
+        if obstacle:
+            # Close on the obstacle only as far as the car could still stop behind where it is
+            # now: traffic that crashes stops dead, not at its braking rate. This also covers
+            # slow_obstacle and brake_obstacle while the obstacle is in view.
+            gap = obstacle.x - (vehicle.x + vehicle.width) - SpeedController.stop_margin
+            ramps.append(SpeedController.approach(vehicle, gap, getattr(obstacle, 'speed', 0)))
+
+        if 'brake_obstacle' in actions and not obstacle:
+            ramps.append(SpeedController.ramp(vehicle.speed, 0, max_decel))
+
+        if 'slow_signal' in actions and yellow_light:
+            ramps.append(SpeedController.ramp(vehicle.speed, 0, SpeedController.stop_decel(vehicle, yellow_light.x)))
+
+        if 'slow_limit' in actions:
+            ramps.append(SpeedController.ramp(vehicle.speed, game.get_current_env().speed_limit, vehicle.deceleration))
+
+        if 'slow_weather' in actions:
+            ramps.append(SpeedController.ramp(vehicle.speed, SpeedController.weather_speed, vehicle.deceleration))
+
+        length = max(len(r) for r in ramps)
+        return [min(r[min(k, len(r) - 1)] for r in ramps) for k in range(length)]
+
+    def track(self, game, vehicle):
+        obstacle = SpeedController.nearest_obstacle(game, vehicle)
+        if obstacle:
+            self.tracked, self.tracked_id, self.missed = obstacle, obstacle.id, 0
+        elif (self.tracked and self.tracked.id == self.tracked_id and self.tracked.x > vehicle.x
+              and self.missed < SpeedController.track_frames):
+            # Respawned traffic takes a new id, so a recycled object is never followed
+            self.missed += 1
+            obstacle = self.tracked
+        else:
+            self.tracked = None
+        return obstacle
+
+    def speed_cap(self, game, vehicle):
+        actions = frozenset(game.compliance_actions)
+        obstacle = self.track(game, vehicle)
+        red_light = SpeedController.nearest_light(game, vehicle, "red")
+        yellow_light = SpeedController.nearest_light(game, vehicle, "yellow")
+        # The obstacle's speed is part of the key so a braking leader triggers a re-plan
+        key = (actions, obstacle.id if obstacle else None, round(getattr(obstacle, 'speed', 0)),
+               red_light.id if red_light else None, yellow_light.id if yellow_light else None)
+        if key != self.plan_key:
+            self.plan_key = key
+            self.profile = self.plan(game, vehicle, actions, obstacle, red_light, yellow_light)
+            self.step = 0
+
+        if not self.profile:
+            return None
+        speed = self.profile[min(self.step, len(self.profile) - 1)]
+        self.step += 1
+        return speed
+
+class PhantomObstacle(GameObject):
+    # A stationary object reported by a sensor false positive; lives for a single frame
+    def __init__(self, x, y, w, h):
+        super().__init__(x, y, w, h)
+        self.speed = 0
+        self.crashed = False
+
+    def init_id(self):
+        self.id = -2
+
+class SensorDetections:
+    def __init__(self):
+        self.vehicles = []
+        self.traffic_lights = []
+        self.pedestrians = []
+
+class SensorModel:
+    # Applies speed error, detection dropouts and false positives from each vehicle's
+    # sensor profile. Noise for the whole frame comes from one batched draw, and the
+    # results are cached until the next update() so every consumer sees the same readings.
+    def __init__(self, seed=None):
+        self.rng = np.random.default_rng(seed)
+        self.frame = -1
+        self.speed_readings = {}
+        self.detections = {}
+
+    def update(self, game):
+        self.update_many([game])
+
+    def update_many(self, games):
+        # Several worlds can share one model and be sampled in the same draw
+        vehicles = []
+        owners = []
+        for game in games:
+            vehicles.extend(game.get_current_env().vehicles)
+            owners.extend([game] * len(game.get_current_env().vehicles))
+        n = len(vehicles)
+
+        # Collect every (sensing vehicle, object) pair that the sensor geometry can see
+        pair_owner = []
+        pair_object = []
+        pair_kind = []
+        pair_prob = []
+        for i, vehicle in enumerate(vehicles):
+            game = owners[i]
+            env = game.get_current_env()
+            sensor = vehicle.get_sensor_rect()
+            for other in env.lanes.vehicles_near(vehicle, Vehicle.obstacle_detection_range):
+                if other is not vehicle and sensor.colliderect(other.get_collision_bounds()) and (not other.crashed or vehicle is game.car):
+                    pair_owner.append(i)
+                    pair_object.append(other)
+                    pair_kind.append('vehicles')
+                    pair_prob.append(vehicle.obstacle_detection)
+            for light in env.traffic_lights:
+                if sensor.colliderect(light.get_collision_bounds()) and light.x - vehicle.x < Vehicle.light_detection_range:
+                    pair_owner.append(i)
+                    pair_object.append(light)
+                    pair_kind.append('traffic_lights')
+                    pair_prob.append(vehicle.light_detection)
+            for pedestrian in env.pedestrians:
+                if sensor.colliderect(pedestrian.get_collision_bounds()) and (not pedestrian.crashed or vehicle is game.car):
+                    pair_owner.append(i)
+                    pair_object.append(pedestrian)
+                    pair_kind.append('pedestrians')
+                    pair_prob.append(vehicle.obstacle_detection)
+
+        m = len(pair_object)
+        draws = self.rng.random(3 * n + m)
+        speed_u, fp_u, fp_pos_u, pair_u = draws[:n], draws[n:2 * n], draws[2 * n:3 * n], draws[3 * n:]
+
+        speeds = np.fromiter((v.speed for v in vehicles), dtype=float, count=n)
+        accuracy = np.fromiter((v.speed_accuracy for v in vehicles), dtype=float, count=n)
+        fp_rate = np.fromiter((v.false_positive for v in vehicles), dtype=float, count=n)
+        speed_range = speeds * (1 - accuracy)
+        readings = speeds - speed_range + speed_u * 2 * speed_range
+        false_positives = fp_u < fp_rate
+        detected = pair_u < np.asarray(pair_prob, dtype=float)
+
+        self.frame = max(game.game_frame for game in games)
+        self.speed_readings = {}
+        self.detections = {}
+        for i, vehicle in enumerate(vehicles):
+            self.speed_readings[vehicle] = float(readings[i])
+            detections = SensorDetections()
+            if false_positives[i]:
+                sensor = vehicle.get_sensor_rect()
+                phantom_x = sensor.x + vehicle.width * 2 + int(fp_pos_u[i] * (sensor.width - vehicle.width * 2))
+                detections.vehicles.append(PhantomObstacle(phantom_x, sensor.y, vehicle.width, vehicle.height))
+            self.detections[vehicle] = detections
+
+        for k in np.flatnonzero(detected):
+            getattr(self.detections[vehicles[pair_owner[k]]], pair_kind[k]).append(pair_object[k])
+
+    def speed_reading(self, vehicle):
+        return self.speed_readings.get(vehicle, vehicle.speed)
+
+    def detected(self, vehicle):
+        return self.detections.get(vehicle, SensorDetections())
+
+class Lane:
+    def __init__(self, side, y):
+        self.side = side
+        self.y = y
+        self.vehicles = []
+        self.positions = []
+
+class LaneChange:
+    def __init__(self, vehicle, from_lane, to_lane):
+        self.vehicle = vehicle
+        self.from_lane = from_lane
+        self.to_lane = to_lane
+
+class LaneMap:
+    # Vehicles bucketed by lane, each lane kept sorted by x. Leader/follower lookups are
+    # neighbours in the lane list, and sensor candidates come from a bisect on x rather
+    # than a scan over every vehicle.
+    def __init__(self, road_height):
+        self.lane_spacing = road_height // 3
+        self.lanes = {side: Lane(side, HEIGHT // 2 + side * self.lane_spacing) for side in LANES}
+        self.members = {}
+        self.events = []
+        self.max_length = max(p['width'] for p in Vehicle.vehicle_profiles.values())
+
+    def lane_of(self, vehicle):
+        side = round((vehicle.y - HEIGHT // 2) / self.lane_spacing)
+        return max(LANES[0], min(LANES[-1], side))
+
+    def update(self, vehicles):
+        self.events = []
+        present = set(vehicles)
+        for vehicle in vehicles:
+            side = self.lane_of(vehicle)
+            member = self.members.get(vehicle)
+            if member is None or member[1] != vehicle.id:
+                # New or respawned vehicle (reset() assigns a new id): not a lane change
+                if member:
+                    self.lanes[member[0]].vehicles.remove(vehicle)
+                self.lanes[side].vehicles.append(vehicle)
+            elif member[0] != side:
+                self.lanes[member[0]].vehicles.remove(vehicle)
+                self.lanes[side].vehicles.append(vehicle)
+                self.events.append(LaneChange(vehicle, member[0], side))
+            self.members[vehicle] = (side, vehicle.id)
+
+        for vehicle in [v for v in self.members if v not in present]:
+            self.lanes[self.members.pop(vehicle)[0]].vehicles.remove(vehicle)
+
+        for lane in self.lanes.values():
+            # Lanes are nearly sorted from the previous frame, which timsort handles in linear time
+            lane.vehicles.sort(key=lambda v: v.x)
+            lane.positions = [v.x for v in lane.vehicles]
+            for i, vehicle in enumerate(lane.vehicles):
+                vehicle.lane = lane.side
+                vehicle.lane_index = i
+
+    def leader(self, vehicle):
+        lane = self.lanes[vehicle.lane]
+        i = vehicle.lane_index + 1
+        return lane.vehicles[i] if i < len(lane.vehicles) else None
+
+    def follower(self, vehicle):
+        lane = self.lanes[vehicle.lane]
+        i = vehicle.lane_index - 1
+        return lane.vehicles[i] if i >= 0 else None
+
+    def vehicles_near(self, vehicle, distance):
+        # Candidates in the vehicle's lane and its neighbours from just behind it to distance ahead
+        side = self.lane_of(vehicle)
+        for lane_side in (side - 1, side, side + 1):
+            lane = self.lanes.get(lane_side)
+            if lane:
+                lo = bisect.bisect_left(lane.positions, vehicle.x - self.max_length)
+                hi = bisect.bisect_right(lane.positions, vehicle.x + distance)
+                yield from lane.vehicles[lo:hi]
+
+    def merge_times(self, vehicle):
+        leader = self.leader(vehicle)
+        follower = self.follower(vehicle)
+        leader_time = 100000
+        follower_time = 100000
+        if leader:
+            leader_time = Vehicle.calc_time_to_intercept(vehicle.x + vehicle.width, leader.x, vehicle.speed, leader.speed)
+        if follower:
+            follower_time = Vehicle.calc_time_to_intercept(follower.x + follower.width, vehicle.x, follower.speed, vehicle.speed)
+        return leader_time, follower_time
+
+class WorldChunk:
+    def __init__(self, index):
+        self.index = index
+        self.start_x = index * CHUNK_LENGTH
+        self.end_x = self.start_x + CHUNK_LENGTH
+        self.traffic_lights = []
+        self.trees = []
+        self.buildings = []
+
+class WorldGenerator:
+    # Streams road chunks from a seed as the car advances. Only the chunks around the car
+    # are kept; traffic outside sensor range is parked in far_vehicles and only integrated
+    # kinematically, so memory and per-frame cost stay constant over any route length.
+    def __init__(self, seed, environment):
+        self.seed = seed
+        self.environment = environment
+        self.chunks = {}
+        self.far_vehicles = []
+        self.rng = random.Random(f"{seed}:{environment}:traffic")
+
+    def generate_chunk(self, game, index):
+        rng = random.Random(f"{self.seed}:{self.environment}:{index}")
+        chunk = WorldChunk(index)
+        road_height = game.get_current_env().road_height
+
+        if self.environment == CITY:
+            for side in [-1, 1]:
+                x = chunk.start_x
+                while x < chunk.end_x:
+                    width = rng.randint(60, 100)
+                    height = rng.randint(100, 200)
+                    y = HEIGHT // 2 - height - road_height // 2 if side < 0 else HEIGHT // 2 + road_height // 2
+                    chunk.buildings.append(Building(x, y, width, height, rng))
+                    x += width + 50
+
+            if index > 0 and rng.random() < 0.5:
+                light = TrafficLight(game)
+                light.place(chunk.start_x + rng.randint(0, CHUNK_LENGTH), rng.choice(["red", "yellow", "green"]), rng.randint(100, 200))
+                chunk.traffic_lights.append(light)
+        else:
+            for i in range(rng.randint(5, 10)):
+                side = rng.choice([-1, 1])
+                y = HEIGHT // 2 + (road_height // 2 + rng.randint(20, 100)) * side
+                chunk.trees.append(Tree(chunk.start_x + rng.randint(0, CHUNK_LENGTH), y, rng.randint(30, 50)))
+
+        # Traffic density varies per chunk; nothing spawns on top of the car's starting chunk
+        if index > 0:
+            density = rng.uniform(TRAFFIC_PER_CHUNK - 1, TRAFFIC_PER_CHUNK + 1)
+            for i in range(int(density + rng.random())):
+                vehicle = Vehicle(game)
+                vehicle.place(game, chunk.start_x + rng.randint(0, CHUNK_LENGTH), rng.choice([-1, 0, 1]),
+                              rng.choice(['sedan', 'sports_car', 'delivery_truck']), rng.randrange(75, 120)/100)
+                self.far_vehicles.append(vehicle)
+
+        return chunk
+
+    def respawn(self, game, vehicle, start_x, end_x):
+        # Traffic that leaves the loaded chunks comes back at the other end with a speed relative
+        # to the car: slower traffic ahead for it to catch up with, faster traffic from behind
+        # that overtakes it. This keeps the car's surroundings populated at any speed. Traffic
+        # from behind only comes while the car is moving at traffic speed and is no faster than
+        # normal traffic, so it doesn't run into the car when it stops.
+        rng = self.rng
+        car = game.car
+        speed_limit = game.get_current_env().speed_limit
+        delta = speed_limit * rng.uniform(0.1, 0.4)
+        behind = vehicle.x >= start_x and car.speed >= speed_limit * TRAFFIC_SPEED[0]
+        if behind:
+            x = start_x + rng.randint(0, CHUNK_LENGTH // 4)
+            speed = min(car.speed + delta, speed_limit * TRAFFIC_SPEED[1])
+        else:
+            x = end_x - rng.randint(0, CHUNK_LENGTH // 4)
+            speed = max(car.speed - delta, speed_limit * 0.25)
+
+        old_id = vehicle.id
+        vehicle.init_id()
+        GameObject._free_ids.append(old_id)
+        vehicle.place(game, x, rng.choice(LANES), rng.choice(['sedan', 'sports_car', 'delivery_truck']), speed / speed_limit)
+
+    def update(self, game):
+        env = game.get_current_env()
+        car_chunk = int(game.car.x // CHUNK_LENGTH)
+        first = car_chunk - CHUNKS_BEHIND
+        last = car_chunk + CHUNKS_AHEAD
+
+        changed = False
+        for index in [i for i in self.chunks if i < first]:
+            chunk = self.chunks.pop(index)
+            for obj in chunk.traffic_lights + chunk.trees + chunk.buildings:
+                obj.release_id()
+            changed = True
+        for index in range(first, last + 1):
+            if index not in self.chunks:
+                self.chunks[index] = self.generate_chunk(game, index)
+                changed = True
+
+        if changed:
+            chunks = [self.chunks[i] for i in sorted(self.chunks)]
+            env.traffic_lights[:] = [light for chunk in chunks for light in chunk.traffic_lights]
+            env.trees[:] = [tree for chunk in chunks for tree in chunk.trees]
+            env.buildings[:] = [building for chunk in chunks for building in chunk.buildings]
+
+        # Low-detail traffic: no sensors or collisions, just constant speed
+        for vehicle in self.far_vehicles:
+            vehicle.x += vehicle.speed
+
+        # Move traffic between the detailed and low-detail sets. Anything outside the loaded chunks
+        # is respawned while the window holds less than its average traffic, and dropped otherwise.
+        start_x = first * CHUNK_LENGTH
+        end_x = (last + 1) * CHUNK_LENGTH
+        max_traffic = int(TRAFFIC_PER_CHUNK * (last - first + 1))
+        near = []
+        far = []
+        leaving = []
+        for vehicle in env.vehicles + self.far_vehicles:
+            if vehicle is game.car or abs(vehicle.x - game.car.x) <= Vehicle.obstacle_detection_range:
+                near.append(vehicle)
+            elif start_x <= vehicle.x < end_x:
+                far.append(vehicle)
+            else:
+                leaving.append(vehicle)
+        for vehicle in leaving:
+            if len(near) + len(far) <= max_traffic:
+                self.respawn(game, vehicle, start_x, end_x)
+                far.append(vehicle)
+            else:
+                vehicle.release_id()
+        env.vehicles[:] = near
+        self.far_vehicles = far
+
 
 class Environment:
     def __init__(self, name, speed_limit):
@@ -505,30 +1038,60 @@ class Environment:
         self.buildings = []
         self.vehicles = []
         self.traffic_lights = []
+        self.pedestrians = []
         self.road_height = HEIGHT // 2
         self.name = name
         self.speed_limit = speed_limit
+        self.world = None
+        self.scripted = False  # Traffic and lights are placed by a script and never recycled
+        self.lanes = LaneMap(self.road_height)
+
+    def clear(self, game):
+        objects = self.lane_markers + self.trees + self.buildings + self.vehicles + self.traffic_lights + self.pedestrians
+        if self.world:
+            objects += self.world.far_vehicles
+        for obj in objects:
+            if obj is not game.car:
+                obj.release_id()
 
-    def setup_highway(self, game):
         self.lane_markers.clear()
         self.trees.clear()
         self.buildings.clear()
         self.vehicles.clear()
         self.traffic_lights.clear()
+        self.pedestrians.clear()
+        self.world = None
+        self.scripted = False
+        self.lanes = LaneMap(self.road_height)
 
-        # Create lane markers
-        marker_spacing = 80
-        for i in range(20):
+    def setup_lane_markers(self, marker_spacing, count, offset):
+        for i in range(count):
             x_pos = i * marker_spacing
-            self.lane_markers.append(LaneMarker(x_pos, HEIGHT // 2 - self.road_height // 6))
-            self.lane_markers.append(LaneMarker(x_pos, HEIGHT // 2 + self.road_height // 6))
+            self.lane_markers.append(LaneMarker(x_pos, HEIGHT // 2 - offset))
+            self.lane_markers.append(LaneMarker(x_pos, HEIGHT // 2 + offset))
+
+    def setup_streamed(self, game, environment, seed):
+        self.clear(game)
+        if environment == CITY:
+            self.setup_lane_markers(60, 25, self.road_height // 2)
+        else:
+            self.setup_lane_markers(80, 20, self.road_height // 6)
+        self.world = WorldGenerator(seed, environment)
+        self.world.update(game)
+
+    def setup_highway(self, game):
+        self.clear(game)
+
+        # Create lane markers
+        self.setup_lane_markers(80, 20, self.road_height // 6)
 
         # Create trees
+        rng = game.rng
         for i in range(30):
-            side = random.choice([-1, 1])
-            x = random.randint(0, WIDTH)
-            y = HEIGHT // 2 + (self.road_height // 2 + random.randint(20, 100)) * side
-            size = random.randint(30, 50)
+            side = rng.choice([-1, 1])
+            x = rng.randint(0, WIDTH)
+            y = HEIGHT // 2 + (self.road_height // 2 + rng.randint(20, 100)) * side
+            size = rng.randint(30, 50)
             self.trees.append(Tree(x, y, size))
 
         # Create vehicles
@@ -536,46 +1099,50 @@ class Environment:
             self.vehicles.append(Vehicle(game))
 
     def setup_city(self, game):
-        self.lane_markers.clear()
-        self.trees.clear()
-        self.buildings.clear()
-        self.vehicles.clear()
-        self.traffic_lights.clear()
+        self.clear(game)
 
         # Create lane markers
-        marker_spacing = 60
-        for i in range(25):
-            x_pos = i * marker_spacing
-            self.lane_markers.append(LaneMarker(x_pos, HEIGHT // 2 - self.road_height // 2))
-            self.lane_markers.append(LaneMarker(x_pos, HEIGHT // 2 + self.road_height // 2))
+        self.setup_lane_markers(60, 25, self.road_height // 2)
 
         self.traffic_lights.append(TrafficLight(game))
 
         # Create buildings
+        rng = game.rng
         for i in range(8):
             # Left side buildings
-            width = random.randint(60, 100)
-            height = random.randint(100, 200)
+            width = rng.randint(60, 100)
+            height = rng.randint(100, 200)
             x = i * (width + 50)  # Added spacing between buildings
-            self.buildings.append(Building(x, HEIGHT // 2 - height - self.road_height // 2, width, height))
+            self.buildings.append(Building(x, HEIGHT // 2 - height - self.road_height // 2, width, height, rng))
             
             # Right side buildings
-            width = random.randint(60, 100)
-            height = random.randint(100, 200)
+            width = rng.randint(60, 100)
+            height = rng.randint(100, 200)
             x = i * (width + 50)  # Added spacing between buildings
-            self.buildings.append(Building(x, HEIGHT // 2 + self.road_height // 2, width, height))
+            self.buildings.append(Building(x, HEIGHT // 2 + self.road_height // 2, width, height, rng))
 
         # Create vehicles
         for i in range(3):
             self.vehicles.append(Vehicle(game))
 
 class Game:
-    def __init__(self):
+    def __init__(self, world_id=0, seed=None):
+        self.world_id = world_id
+        # Each world draws its layout and respawns from its own generator, so worlds stepped
+        # side by side don't change each other's runs
+        self.rng = random.Random(seed)
+        self.sensors = SensorModel()
+        self.environments = {
+            CITY: Environment('City', 30),
+            HIGHWAY: Environment('Highway', 60)
+        }
+        self.streamed_world = False
+        self.world_seed = 0
         self.car = PlayerVehicle(self)
         self.setup_environment(CITY)
         self.draw_collisions = False
         self.target_y = self.car.y
-        self.collisions = set()
+        self.collisions = deque()
         self.game_frame = 0
         self.compliance_actions = []
         self.enforce_compliance = True
@@ -595,27 +1162,38 @@ class Game:
     def get_screen_x(self, query_x):
         return query_x - (self.car.x - CAR_SCREEN_POSITION)
 
-    def setup_environment(self, environment):
+    def setup_environment(self, environment, streamed_world=None, world_seed=None):
+        if streamed_world is not None:
+            self.streamed_world = streamed_world
+        if world_seed is not None:
+            self.world_seed = world_seed
         self.car.reset(self)
         self.current_environment = environment
+        self.env = self.environments[environment]
+        if self.streamed_world:
+            self.env.setup_streamed(self, environment, self.world_seed)
+        elif environment == CITY:
+            self.env.setup_city(self)
+        else:
+            self.env.setup_highway(self)
         self.env.vehicles.append(self.car)
 
     def get_current_env(self):
         return self.env
 
-    def draw_tree(self, tree):
+    def draw_tree(self, tree, x_offset=0):
         pygame.draw.rect(screen, BROWN, 
-                        (tree.x - tree.size // 8, tree.y - tree.size // 2, 
+                        (tree.x + x_offset - tree.size // 8, tree.y - tree.size // 2, 
                          tree.size // 4, tree.size))
         pygame.draw.circle(screen, GREEN, 
-                          (tree.x, tree.y - tree.size // 2), 
+                          (tree.x + x_offset, tree.y - tree.size // 2), 
                           tree.size // 2)
 
-    def draw_building(self, building):
+    def draw_building(self, building, x_offset=0):
         pygame.draw.rect(screen, BUILDING_COLOR, 
-                        (building.x, building.y, building.width, building.height))
-        for window in building.windows:
-            pygame.draw.rect(screen, WINDOW_COLOR, window)
+                        (building.x + x_offset, building.y, building.width, building.height))
+        for x, y, w, h in building.windows:
+            pygame.draw.rect(screen, WINDOW_COLOR, (x + x_offset, y, w, h))
 
     def draw_weather(self):
         if self.weather == Weather.Rain:
@@ -632,16 +1210,40 @@ class Game:
                 pygame.draw.circle(screen, WHITE, (x, y), 2)
 
     def update(self):
+        self.begin_update()
+        self.sensors.update(self)
+        self.simulate()
+        self.end_update(ComplianceModule.update(self.world_id))
+
+    def begin_update(self):
         env = self.get_current_env()
-        
+
+        # Facts only live for one frame; drop any left over from an interrupted update
+        ComplianceModule.begin_world(self.world_id)
+
+        # Stream world chunks in and out around the car
+        if env.world:
+            env.world.update(self)
+
+        # Re-sort the lanes and flag unsafe merges by the player
+        env.lanes.update(env.vehicles)
+        for event in env.lanes.events:
+            if event.vehicle is self.car:
+                ComplianceModule.add_fact('lane_change', *env.lanes.merge_times(self.car))
+
+    def simulate(self):
+        # Runs after the sensors have been sampled for this frame
+        env = self.get_current_env()
+        ComplianceModule.select_world(self.world_id)
+
         # Update traffic lights in city mode
         if self.current_environment == CITY:
             for light in env.traffic_lights:
                 light.update(self)
 
+            for light in self.sensors.detected(self.car).traffic_lights:
                 if self.car.x < light.x:
-                    if abs(self.car.x - light.x) < self.car.light_detection * Vehicle.light_detection_range:
-                        ComplianceModule.add_fact('traffic_signal', light.id, light.x, light.state)
+                    ComplianceModule.add_fact('traffic_signal', light.id, light.x, light.state)
 
         # Update lane markers
         for marker in env.lane_markers:
@@ -654,33 +1256,33 @@ class Game:
             vehicle.update(self)                
 
         # Update trees (highway only)
-        if self.current_environment == HIGHWAY:
+        if self.current_environment == HIGHWAY and not env.world:
             for tree in env.trees:
                 tree.x -= self.car.speed / 4
                 if tree.x < -50:
-                    tree.x = random.randint(1, 3) * WIDTH
-                    tree.y = HEIGHT // 2 + (env.road_height // 2 + random.randint(20, 100)) * random.choice([-1, 1])
+                    tree.x = self.rng.randint(1, 3) * WIDTH
+                    tree.y = HEIGHT // 2 + (env.road_height // 2 + self.rng.randint(20, 100)) * self.rng.choice([-1, 1])
 
         # Update buildings (city only)
-        if self.current_environment == CITY:
+        if self.current_environment == CITY and not env.world:
             for building in env.buildings:
                 building.x -= self.car.speed / 4
                 if building.x + building.width < 0:
                     building.x = WIDTH
-                    building.height = random.randint(100, 200)
+                    building.height = self.rng.randint(100, 200)
                     building.windows = []
-                    building.generate_windows()
+                    building.generate_windows(self.rng)
 
         # Update collisions
         for v in env.vehicles:
             v.update_collisions(self)
 
-        for f in self.collisions.copy():
-            if self.game_frame - f > 60:
-                self.collisions.remove(f)
+        # Collision frames are appended in order, so expired ones are always at the front
+        while self.collisions and self.game_frame - self.collisions[0] > 60:
+            self.collisions.popleft()
 
         # Update compliance system with speed, speed limit, and weather
-        ComplianceModule.add_fact('ego_speed', self.car.get_sensor_speed())
+        ComplianceModule.add_fact('ego_speed', self.car.get_sensor_speed(self))
         ComplianceModule.add_fact('ego_position', self.car.x, self.car.y)
         ComplianceModule.add_fact('speed_limit', env.speed_limit)
         ComplianceModule.add_fact('collision', len(self.collisions) > 0)
@@ -688,8 +1290,9 @@ class Game:
         # Add the current weather to the compliance module
         ComplianceModule.add_fact('weather', self.weather.name)
 
+    def end_update(self, compliance_actions):
         # Get the compliance action based on the updated environment and obstacle information
-        self.compliance_actions = ComplianceModule.update()
+        self.compliance_actions = compliance_actions
         
         # Update frame counter
         self.game_frame += 1
@@ -699,17 +1302,20 @@ class Game:
         screen.fill(DARKER_GRAY)
         env = self.get_current_env()
 
+        # Streamed scenery lives in world coordinates, the recycled scenery in screen coordinates
+        scenery_offset = self.get_screen_x(0) if env.world else 0
+
         # Draw weather effects
         self.draw_weather()
 
         if self.current_environment == HIGHWAY:
             for tree in env.trees:
                 if tree.y < HEIGHT // 2:
-                    self.draw_tree(tree)
+                    self.draw_tree(tree, scenery_offset)
 
         if self.current_environment == CITY:
             for building in env.buildings:
-                self.draw_building(building)
+                self.draw_building(building, scenery_offset)
 
         # Draw road
         pygame.draw.rect(screen, GRAY, (0, HEIGHT // 2 - env.road_height // 2, WIDTH, env.road_height))
@@ -731,7 +1337,7 @@ class Game:
 
         for tree in env.trees:
             if tree.y >= HEIGHT // 2:
-                self.draw_tree(tree)
+                self.draw_tree(tree, scenery_offset)
 
         font = pygame.font.Font(None, 36)
         text_height = font.get_height()
@@ -781,9 +1387,40 @@ class Game:
             flash_surface.fill((255, 255, 255, int(flash_alpha)))
             screen.blit(flash_surface, (0, 0))
 
+def headless_game(environment, seed=0, world_id=0, streamed_world=False, world_seed=None, sensors=None, speed_limit=None):
+    # A Game driven by a script instead of the window: seeded, quiet, with a keys dict to press
+    ComplianceModule.reset(world_id)
+    game = Game(world_id, seed)
+    game.sensors = sensors or SensorModel(seed)
+    game.car.incident_report.verbose = False
+    if speed_limit is not None:
+        game.environments[environment].speed_limit = speed_limit
+    game.setup_environment(environment, streamed_world=streamed_world, world_seed=seed if world_seed is None else world_seed)
+    game.keys = {pygame.K_LEFT: False, pygame.K_RIGHT: False, pygame.K_UP: False, pygame.K_DOWN: False}
+    return game
+
+def cruise(game, speed):
+    # Scripted driver: hold the throttle until the cruise speed is reached
+    game.keys[pygame.K_RIGHT] = game.car.speed < speed
+
 def main():
+    parser = argparse.ArgumentParser(description="Automated Test Dummies")
+    parser.add_argument("--record", metavar="DIR", help="write frames to DIR")
+    parser.add_argument("--record-format", choices=[PNG, RAW], default=PNG)
+    parser.add_argument("--incident-window", type=float, metavar="SECONDS", help="only record frames within SECONDS of an incident")
+    parser.add_argument("--record-scale", type=int, default=1, help="keep every Nth pixel when recording")
+    parser.add_argument("--record-memory", type=int, default=DEFAULT_MEMORY_BUDGET // 2**20, metavar="MB", help="shared memory for the recording ring")
+    args = parser.parse_args()
+
     clock = pygame.time.Clock()
     game = Game()
+    recorder = None
+    if args.record:
+        try:
+            recorder = FrameRecorder(screen, args.record, args.record_format, args.incident_window, scale=args.record_scale,
+                                     memory_budget=args.record_memory * 2**20)
+        except ValueError as e:
+            parser.error(str(e))
     running = True
     current_profile_index = 0
     current_sensor_index = 0
@@ -810,13 +1447,20 @@ def main():
                     game.car.incident_report.print_report()
                 elif event.key == pygame.K_w:
                     game.toggle_weather()
+                elif event.key == pygame.K_g:
+                    game.setup_environment(game.current_environment, streamed_world=not game.streamed_world)
 
         game.keys = pygame.key.get_pressed()
         game.update()
         game.draw()
+        if recorder:
+            recorder.capture(game, screen)
         pygame.display.flip()
         clock.tick(60)
 
+    if recorder:
+        recorder.close()
+        print(f"Recorded {recorder.recorded} frames ({recorder.dropped} skipped)")
     pygame.quit()
     sys.exit()
 
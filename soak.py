@@ -0,0 +1,184 @@
+import os
+import gc
+import csv
+import time
+import random
+import resource
+import argparse
+
+import pygame
+from compliance import ComplianceModule
+from sim import GameObject, IncidentType, CITY, HIGHWAY, headless_game, cruise
+
+def resident_memory():
+    # Current RSS in bytes; falls back to the peak where /proc is unavailable
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Bucket:
+    def __init__(self, start_frame):
+        self.start_frame = start_frame
+        self.frames = 0
+        self.speed_sum = 0.0
+        self.speed_min = float("inf")
+        self.speed_max = 0.0
+        self.actions = {}
+        self.incidents = 0
+
+    def add(self, speed, actions, incidents):
+        self.frames += 1
+        self.speed_sum += speed
+        self.speed_min = min(self.speed_min, speed)
+        self.speed_max = max(self.speed_max, speed)
+        for action in actions:
+            self.actions[action] = self.actions.get(action, 0) + 1
+        self.incidents += incidents
+
+    def merge(self, other):
+        self.frames += other.frames
+        self.speed_sum += other.speed_sum
+        self.speed_min = min(self.speed_min, other.speed_min)
+        self.speed_max = max(self.speed_max, other.speed_max)
+        for action, count in other.actions.items():
+            self.actions[action] = self.actions.get(action, 0) + count
+        self.incidents += other.incidents
+
+    @property
+    def speed_mean(self):
+        return self.speed_sum / self.frames if self.frames else 0.0
+
+class Downsampler:
+    # Fixed number of buckets over the whole run: when they fill up, neighbouring buckets
+    # are merged and each bucket covers twice as many frames from then on.
+    def __init__(self, resolution=512):
+        self.resolution = resolution
+        self.frames_per_bucket = 1
+        self.buckets = []
+
+    def add(self, frame, speed, actions, incidents):
+        if not self.buckets or self.buckets[-1].frames >= self.frames_per_bucket:
+            if len(self.buckets) >= self.resolution:
+                self.compact()
+            self.buckets.append(Bucket(frame))
+        self.buckets[-1].add(speed, actions, incidents)
+
+    def compact(self):
+        merged = []
+        for i in range(0, len(self.buckets), 2):
+            bucket = self.buckets[i]
+            if i + 1 < len(self.buckets):
+                bucket.merge(self.buckets[i + 1])
+            merged.append(bucket)
+        self.buckets = merged
+        self.frames_per_bucket *= 2
+
+class SoakTest:
+    def __init__(self, environment=HIGHWAY, seed=0, resolution=512, report_interval=3600, cruise_speed=40):
+        self.game = headless_game(environment, seed, streamed_world=True)
+        self.keys = self.game.keys
+        self.rng = random.Random(seed)
+        self.series = Downsampler(resolution)
+        self.report_interval = report_interval
+        self.cruise_speed = cruise_speed
+        self.lane_change_frames = 0
+        self.samples = []
+
+    def drive(self):
+        # Scripted driver: hold the cruise speed, change lanes and weather now and then
+        game = self.game
+        cruise(game, self.cruise_speed)
+        if self.lane_change_frames > 0:
+            self.lane_change_frames -= 1
+        elif self.rng.random() < 0.002:
+            direction = self.rng.choice([pygame.K_UP, pygame.K_DOWN])
+            self.keys[pygame.K_UP] = direction == pygame.K_UP
+            self.keys[pygame.K_DOWN] = direction == pygame.K_DOWN
+            self.lane_change_frames = 30
+        else:
+            self.keys[pygame.K_UP] = self.keys[pygame.K_DOWN] = False
+        if self.rng.random() < 0.0005:
+            game.toggle_weather()
+
+    def sample(self):
+        game = self.game
+        env = game.get_current_env()
+        world_vehicles = len(env.vehicles) + (len(env.world.far_vehicles) if env.world else 0)
+        return {
+            "frame": game.game_frame,
+            "rss_mb": resident_memory() / (1024 * 1024),
+            "gc_objects": len(gc.get_objects()),
+            "vehicles": world_vehicles,
+            "chunks": len(env.world.chunks) if env.world else 0,
+            "next_object_id": GameObject._current_object_id,
+            "event_log": len(game.car.incident_report.event_log),
+            "decision_cache": (ComplianceModule.cache_stats() or {}).get("size", 0)
+        }
+
+    def run(self, frames, on_sample=None):
+        game = self.game
+        report = game.car.incident_report
+        for _ in range(frames):
+            incidents_before = report.total_incidents
+            self.drive()
+            game.update()
+            self.series.add(game.game_frame, game.car.speed, game.compliance_actions, report.total_incidents - incidents_before)
+            if game.game_frame % self.report_interval == 0:
+                # Keep memory samples at the report resolution too
+                sample = self.sample()
+                self.samples.append(sample)
+                if len(self.samples) > self.series.resolution:
+                    self.samples = self.samples[::2]
+                if on_sample:
+                    on_sample(sample)
+        return self.series
+
+    def write_series(self, path):
+        action_names = sorted({a for bucket in self.series.buckets for a in bucket.actions})
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["start_frame", "frames", "speed_mean", "speed_min", "speed_max", "incidents"] + action_names)
+            for bucket in self.series.buckets:
+                writer.writerow([bucket.start_frame, bucket.frames, f"{bucket.speed_mean:.3f}", f"{bucket.speed_min:.3f}",
+                                 f"{bucket.speed_max:.3f}", bucket.incidents] + [bucket.actions.get(a, 0) for a in action_names])
+
+    def print_report(self):
+        report = self.game.car.incident_report
+        print(f"Soak test: {self.game.game_frame} frames, {self.series.frames_per_bucket} frames per bucket")
+        for incident_type in IncidentType:
+            print(f"    {incident_type.name}: {report.incident_counts[incident_type]}")
+        if self.samples:
+            first, last = self.samples[0], self.samples[-1]
+            print(f"    RSS: {first['rss_mb']:.1f} MB -> {last['rss_mb']:.1f} MB")
+            print(f"    gc objects: {first['gc_objects']} -> {last['gc_objects']}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the simulator headless for a long time and track memory")
+    parser.add_argument("--hours", type=float, default=1.0, help="simulated hours at 60 frames per second")
+    parser.add_argument("--environment", choices=[CITY, HIGHWAY], default=HIGHWAY)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--resolution", type=int, default=512, help="number of time-series buckets to keep")
+    parser.add_argument("--report-interval", type=int, default=3600, help="frames between memory samples")
+    parser.add_argument("--output", metavar="CSV", help="write the downsampled time series to CSV")
+    parser.add_argument("--decision-cache", action="store_true", help="enable the compliance decision cache")
+    args = parser.parse_args()
+
+    if args.decision_cache:
+        ComplianceModule.enable_cache()
+    soak = SoakTest(args.environment, args.seed, args.resolution, args.report_interval)
+    start = time.time()
+
+    def print_sample(sample):
+        elapsed = time.time() - start
+        print(f"[{elapsed:8.1f}s] frame {sample['frame']}: rss {sample['rss_mb']:.1f} MB, {sample['gc_objects']} objects, "
+              f"{sample['vehicles']} vehicles, {sample['chunks']} chunks, next id {sample['next_object_id']}")
+
+    soak.run(int(args.hours * 3600 * 60), on_sample=print_sample)
+    soak.print_report()
+    if args.output:
+        soak.write_series(args.output)
+
+if __name__ == "__main__":
+    main()